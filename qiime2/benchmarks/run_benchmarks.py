@@ -0,0 +1,291 @@
+"""
+Benchmark suite for the organizer pipeline on synthetic data (see synthetic.py).
+
+Times every public function of functions/ProcessHelper.py,
+PromptValues.compute_global_sample_order, the sheet computation and
+the sequential / pipelined multi-sheet runs (functions/ProcessSheet.py), and both end-to-end
+scripts (taxa_organizer.py, taxa_organized_organizer.py) at several scales.
+
+Usage (from the qiime2 folder):
+    python -m benchmarks.run_benchmarks                          # all scales, print results
+    python -m benchmarks.run_benchmarks --scales small --save    # store baselines/<commit>.json
+    python -m benchmarks.run_benchmarks --compare benchmarks/baselines/<commit>.json
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+QIIME2_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, QIIME2_DIR)
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import write_dataset
+from functions.config import TAXON_TOP_LABEL
+from functions.LineageIndex import LabelIndex
+from functions.ProcessHelper import build_site_header_row, find_read_sheet_name, \
+    append_total_reads_row, check_minor_threshold, minor_group_label, drop_minor_rows, compute_minor_unidentified_identified_total, \
+    append_summary_rows, compute_ranking_blocks, append_ranking_rows, round_sheet_values, rank_color_cells, \
+    write_sheet_with_formatting
+from functions.ProcessSheet import list_target_sheets, compute_sheet, process_sheets_pipelined
+from functions.Renderers import TsvRenderer, HtmlRenderer, ExcelRenderer
+from functions.PromptValues import get_site_order, compute_global_sample_order, \
+    apply_global_sample_order_to_df
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+
+SCALES = {
+    "small":  dict(n_asv=300,  n_samples=24,   sparsity=0.7),
+    "medium": dict(n_asv=1500, n_samples=200,  sparsity=0.8),
+    "large":  dict(n_asv=4000, n_samples=1000, sparsity=0.85),
+}
+BENCH_SHEET = "G_rank(%)"
+# threshold above the organizer's 1% cut, so drop_minor_rows has rows to drop
+BENCH_MINOR_THRESHOLD = 2.0
+
+# stdin answers for taxa_organizer.py prompts (mode, domain, file name, distance ranks)
+ORGANIZER_ANSWERS = "new\nBAC\nbench.xlsx\n\n"
+
+# taxa_organized_organizer.main() with the GUI sort prompt replaced by a fixed site/round spec
+ORGANIZED_HARNESS = """
+import sys
+sys.path.insert(0, {qiime2_dir!r})
+import taxa_organized_organizer as t
+from functions.Metadata import as_metadata
+from functions.PromptValues import get_site_order
+t.get_user_sort_spec_from_metadata = lambda meta_df, sampleid_col="sampleid": {{
+    "site": get_site_order(meta_df), "round": sorted(as_metadata(meta_df).unique("round"))}}
+t.main()
+"""
+
+
+def timed(fn: Callable, setup: Optional[Callable] = None, repeat: int = 5) -> Dict:
+    """Run fn(*setup()) `repeat` times; setup time is excluded. Returns seconds (min/median)."""
+    times = []
+    for _ in range(repeat):
+        args = setup() if setup else ()
+        t0 = time.perf_counter()
+        fn(*args)
+        times.append(time.perf_counter() - t0)
+    return {"min": min(times), "median": statistics.median(times), "repeat": repeat}
+
+
+def bench_functions(paths: Dict[str, str], repeat: int) -> Dict[str, Dict]:
+    """Per-function timings on the G_rank(%) sheet, inputs prepared as process_sheet does."""
+    xf = pd.ExcelFile(paths["organized"])
+    meta_df = pd.read_csv(paths["metadata"], sep="\t", dtype=str)
+    sheet_df = xf.parse(BENCH_SHEET)
+    read_sheet = find_read_sheet_name(BENCH_SHEET)
+    read_df = xf.parse(read_sheet)
+    sort_spec = {"site": get_site_order(meta_df), "round": sorted(meta_df["round"].unique())}
+
+    res = {}
+    res["compute_global_sample_order"] = timed(
+        lambda: compute_global_sample_order(meta_df, sort_spec, sampleid_col="sampleid"), repeat=repeat)
+    order = compute_global_sample_order(meta_df, sort_spec, sampleid_col="sampleid")
+
+    res["build_site_header_row"] = timed(lambda: build_site_header_row(sheet_df, meta_df), repeat=repeat)
+    df = build_site_header_row(sheet_df, meta_df)
+
+    res["find_read_sheet_name"] = timed(lambda: find_read_sheet_name(BENCH_SHEET), repeat=repeat)
+    res["check_minor_threshold"] = timed(lambda: check_minor_threshold(BENCH_MINOR_THRESHOLD), repeat=repeat)
+    res["minor_group_label"] = timed(lambda: minor_group_label(BENCH_MINOR_THRESHOLD), repeat=repeat)
+    res["drop_minor_rows"] = timed(lambda: drop_minor_rows(sheet_df, BENCH_MINOR_THRESHOLD), repeat=repeat)
+
+    res["append_total_reads_row"] = timed(lambda: append_total_reads_row(df, read_df), repeat=repeat)
+    df = apply_global_sample_order_to_df(append_total_reads_row(df, read_df), order)
+
+    # mutates its input (drops rows): fresh copy per run
+    res["compute_minor_unidentified_identified_total"] = timed(
+        compute_minor_unidentified_identified_total, setup=lambda: (df.copy(),), repeat=repeat)
+    summary_df = df.copy()
+    summary = compute_minor_unidentified_identified_total(summary_df)
+
+    res["append_summary_rows"] = timed(lambda: append_summary_rows(summary_df, *summary), repeat=repeat)
+    df_out = append_summary_rows(summary_df, *summary)
+
+    res["compute_ranking_blocks"] = timed(lambda: compute_ranking_blocks(df_out), repeat=repeat)
+    row_colors, rows_values, row_sum_1_3, row_sum_1_5, rows_taxa, top_taxa_by_rank = compute_ranking_blocks(df_out)
+
+    res["append_ranking_rows"] = timed(
+        lambda: append_ranking_rows(df_out, row_colors, rows_values, row_sum_1_3, row_sum_1_5, rows_taxa),
+        repeat=repeat)
+    df_final = append_ranking_rows(df_out, row_colors, rows_values, row_sum_1_3, row_sum_1_5, rows_taxa)
+
+    top_label = TAXON_TOP_LABEL.get(BENCH_SHEET.split("_", 1)[0], "")
+
+    res["round_sheet_values"] = timed(lambda: round_sheet_values(df_final), repeat=repeat)
+    res["rank_color_cells"] = timed(lambda: rank_color_cells(df_final, top_taxa_by_rank), repeat=repeat)
+    labels = LabelIndex(df_final[df_final.columns[0]])
+    res["rank_color_cells (shared LabelIndex)"] = timed(
+        lambda: rank_color_cells(df_final, top_taxa_by_rank, labels), repeat=repeat)
+
+    def write_and_close(writer):
+        write_sheet_with_formatting(writer, BENCH_SHEET, df_final, top_label, top_taxa_by_rank)
+        writer.close()
+
+    res["write_sheet_with_formatting"] = timed(
+        write_and_close, setup=lambda: (pd.ExcelWriter(io.BytesIO(), engine="xlsxwriter"),), repeat=repeat)
+
+    # non-Excel renderers on the same sheet model
+    out_dir = tempfile.mkdtemp(prefix="ngs-bench-render-")
+    try:
+        for name, cls, target in [("render_tsv", TsvRenderer, os.path.join(out_dir, "tsv")),
+                                  ("render_html", HtmlRenderer, os.path.join(out_dir, "out.html"))]:
+            def render(renderer):
+                renderer.write(BENCH_SHEET, df_final, top_label, top_taxa_by_rank)
+                renderer.close()
+            res[name] = timed(render, setup=lambda: (cls(target),), repeat=repeat)
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+    res.update(bench_sheet_paths(xf, sheet_df, read_df, meta_df, order, repeat))
+    return res
+
+
+def bench_sheet_paths(xf: pd.ExcelFile, sheet_df: pd.DataFrame, read_df: pd.DataFrame, meta_df: pd.DataFrame,
+                      order, repeat: int) -> Dict[str, Dict]:
+    """ProcessSheet paths: one sheet computed, all sheets sequential vs pipelined (xlsx)."""
+    res = {"compute_sheet": timed(lambda: compute_sheet(BENCH_SHEET, sheet_df, read_df, meta_df, order),
+                                  repeat=repeat)}
+
+    sheets = list_target_sheets(xf)
+    out_dir = tempfile.mkdtemp(prefix="ngs-bench-pipeline-")
+    try:
+        for name, depth in [("process_sheets (sequential)", 0), ("process_sheets_pipelined", 2)]:
+            def run_sheets(renderer):
+                process_sheets_pipelined(xf, sheets, renderer, order, meta_df, depth=depth)
+                renderer.close()
+            res[name] = timed(run_sheets, setup=lambda: (ExcelRenderer(os.path.join(out_dir, "out.xlsx")),),
+                              repeat=repeat)
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+    return res
+
+
+def bench_end_to_end(paths: Dict[str, str], repeat: int) -> Dict[str, Dict]:
+    """Wall time of both scripts as subprocesses (includes interpreter start-up and imports)."""
+    cwd = paths["cwd"]
+    organizer = os.path.join(QIIME2_DIR, "taxa_organizer.py")
+
+    def run_organizer():
+        subprocess.run([sys.executable, organizer], input=ORGANIZER_ANSWERS, text=True,
+                       cwd=cwd, check=True, stdout=subprocess.DEVNULL)
+
+    env = dict(os.environ,
+               NGS_EXCEL_IN=paths["organized"],
+               NGS_METADATA=paths["metadata"],
+               NGS_EXCEL_OUT=os.path.join(cwd, "bench-organized.xlsx"))
+    harness = ORGANIZED_HARNESS.format(qiime2_dir=QIIME2_DIR)
+
+    def run_organized():
+        subprocess.run([sys.executable, "-c", harness], cwd=cwd, env=env, check=True,
+                       stdout=subprocess.DEVNULL)
+
+    return {
+        "taxa_organizer.py": timed(run_organizer, repeat=repeat),
+        "taxa_organized_organizer.py": timed(run_organized, repeat=repeat),
+    }
+
+
+def git_commit() -> str:
+    try:
+        sha = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=QIIME2_DIR,
+                             capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=QIIME2_DIR,
+                               capture_output=True, text=True).stdout.strip()
+        return sha + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run(scales, repeat: int, e2e_repeat: int, with_e2e: bool, data_dir: Optional[str]) -> Dict:
+    results = {
+        "commit": git_commit(),
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "scales": {},
+    }
+    for name in scales:
+        params = SCALES[name]
+        root = os.path.join(data_dir, name) if data_dir else tempfile.mkdtemp(prefix=f"ngs-bench-{name}-")
+        try:
+            print(f"[{name}] generating {params}")
+            paths = write_dataset(root, params["n_asv"], params["n_samples"], params["sparsity"])
+            res = bench_functions(paths, repeat)
+            if with_e2e:
+                res.update(bench_end_to_end(paths, e2e_repeat))
+            results["scales"][name] = {"params": params, "benchmarks": res}
+            for bench, stats in res.items():
+                print(f"[{name}] {bench:<45} min {stats['min']:.4f}s  median {stats['median']:.4f}s")
+        finally:
+            if not data_dir:
+                shutil.rmtree(root, ignore_errors=True)
+    return results
+
+
+def compare(current: Dict, baseline: Dict, threshold: float = 1.2) -> None:
+    """Print current/baseline ratios of the median times; ratio > threshold is flagged."""
+    print(f"\ncompare {current['commit']} vs baseline {baseline['commit']}")
+    print(f"{'scale':<8}{'benchmark':<46}{'base(s)':>10}{'now(s)':>10}{'ratio':>8}")
+    for scale, cur in current["scales"].items():
+        base = baseline.get("scales", {}).get(scale)
+        if base is None:
+            continue
+        if base["params"] != cur["params"]:
+            print(f"{scale:<8}(parameters differ from baseline, skipped)")
+            continue
+        for bench, stats in cur["benchmarks"].items():
+            b = base["benchmarks"].get(bench)
+            if b is None:
+                continue
+            ratio = stats["median"] / b["median"] if b["median"] else float("inf")
+            flag = "  SLOWER" if ratio > threshold else ("  faster" if ratio < 1 / threshold else "")
+            print(f"{scale:<8}{bench:<46}{b['median']:>10.4f}{stats['median']:>10.4f}{ratio:>8.2f}{flag}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--scales", default=",".join(SCALES), help="comma-separated subset of " + ", ".join(SCALES))
+    ap.add_argument("--repeat", type=int, default=5, help="repeats per function benchmark")
+    ap.add_argument("--e2e-repeat", type=int, default=1, help="repeats per end-to-end script")
+    ap.add_argument("--no-e2e", action="store_true", help="skip the end-to-end scripts")
+    ap.add_argument("--data-dir", help="keep generated datasets here instead of a temp dir")
+    ap.add_argument("--save", action="store_true", help=f"write results to {BASELINE_DIR}/<commit>.json")
+    ap.add_argument("--compare", help="baseline JSON to compare against")
+    args = ap.parse_args()
+
+    scales = [s.strip() for s in args.scales.split(",") if s.strip()]
+    unknown = [s for s in scales if s not in SCALES]
+    if unknown:
+        ap.error(f"unknown scales: {unknown}")
+
+    results = run(scales, args.repeat, args.e2e_repeat, not args.no_e2e, args.data_dir)
+
+    if args.save:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        out = os.path.join(BASELINE_DIR, f"{results['commit']}.json")
+        with open(out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print("baseline saved:", out)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
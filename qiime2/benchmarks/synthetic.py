@@ -0,0 +1,167 @@
+"""
+Synthetic QIIME2-shaped inputs for the benchmarks.
+
+Writes the same files the pipeline reads, laid out like a real project so the
+end-to-end scripts can run unchanged from <root>/qiime2:
+
+    <root>/result/<DOMAIN>/level-7.csv               barplot CSV (taxonomic level 7)
+    <root>/result/<DOMAIN>/metadata.tsv              taxonomy TSV (Feature ID, Taxon, Confidence)
+    <root>/fastq/sample-metadata-<domain>.tsv        sample metadata (sampleid, site, round)
+    <root>/qiime2/taxa-organized/synthetic-<DOMAIN>.xlsx  taxa-organized workbook (taxa_organizer output)
+
+ARC and BAC datasets can share one root (as taxa_combined_organizer expects).
+
+Abundances follow a power law over ASVs (a few dominant taxa, a long rare tail),
+and `sparsity` is the fraction of zero cells in the ASV x sample table.
+
+Usage (from the qiime2 folder):
+    python -m benchmarks.synthetic --asvs 2000 --samples 200 --sparsity 0.8 --out /tmp/ngs-bench
+"""
+import argparse
+import os
+import sys
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from functions.config import SITE_ORDER_BASE
+from functions.OrganizeHelper import split_lineage, build_otus, build_organized_sheets
+
+UNID_LABELS = ["uncultured", "metagenome", "Ambiguous_taxa", ""]
+
+
+def make_lineages(n_asv: int, rng: np.random.Generator, domain: str = "Bacteria",
+                  unid_rate: float = 0.1) -> list:
+    """
+    One 'D_0__...;D_6__...' lineage per ASV on a random hierarchy.
+    ASVs are assigned to genera with power-law sizes; a fraction of labels
+    below phylum level is replaced by uncultured/metagenome/empty.
+    """
+    n_genus = max(5, n_asv // 6)
+    n_family = max(4, n_genus // 3)
+    n_order = max(3, n_family // 3)
+    n_class = max(8, n_order // 2)
+    n_phylum = max(5, n_class // 2)
+
+    family_of_genus = rng.integers(0, n_family, n_genus)
+    order_of_family = rng.integers(0, n_order, n_family)
+    class_of_order = rng.integers(0, n_class, n_order)
+    phylum_of_class = rng.integers(0, n_phylum, n_class)
+
+    genus_weights = 1.0 / np.arange(1, n_genus + 1) ** 1.1
+    genus_of_asv = rng.choice(n_genus, size=n_asv, p=genus_weights / genus_weights.sum())
+
+    lineages = []
+    for a, g in enumerate(genus_of_asv):
+        f = family_of_genus[g]
+        o = order_of_family[f]
+        c = class_of_order[o]
+        p = phylum_of_class[c]
+        labels = [domain, f"Phylum{p}", f"Class{c}", f"Order{o}", f"Family{f}", f"Genus{g}", f"Genus{g} sp{a % 7}"]
+        for lvl in range(2, 7):
+            if rng.random() < unid_rate:
+                labels[lvl] = UNID_LABELS[rng.integers(0, len(UNID_LABELS))]
+        lineages.append(";".join(f"D_{i}__{lab}" for i, lab in enumerate(labels)))
+    return lineages
+
+
+def make_counts(n_asv: int, n_samples: int, sparsity: float, rng: np.random.Generator,
+                alpha: float = 1.2, depth=(10_000, 60_000)) -> np.ndarray:
+    """
+    ASV x sample read counts. ASV weights ~ rank^-alpha with per-sample lognormal
+    noise; cells are zeroed with probability `sparsity` (the most abundant ASV of
+    each sample is always kept so no sample is empty).
+    """
+    weights = 1.0 / np.arange(1, n_asv + 1) ** alpha
+    rng.shuffle(weights)
+    counts = np.empty((n_asv, n_samples), dtype=np.int64)
+    for j in range(n_samples):
+        w = weights * rng.lognormal(0.0, 1.0, n_asv)
+        w[rng.random(n_asv) < sparsity] = 0
+        if not w.any():
+            w[np.argmax(weights)] = 1.0
+        reads = rng.integers(depth[0], depth[1])
+        counts[:, j] = rng.multinomial(reads, w / w.sum())
+    return counts
+
+
+def make_metadata(n_samples: int, rng: np.random.Generator, domain: str = "BAC") -> pd.DataFrame:
+    """sampleid / site / round; sites drawn from SITE_ORDER_BASE, sample ids like 'BSSG-r2-BAC-0007'."""
+    sites = rng.choice(SITE_ORDER_BASE, size=n_samples)
+    rounds = rng.integers(1, 5, n_samples).astype(str)
+    sids = [f"{s}-r{r}-{domain}-{i:04d}" for i, (s, r) in enumerate(zip(sites, rounds))]
+    return pd.DataFrame({"sampleid": sids, "site": sites, "round": rounds})
+
+
+def write_dataset(root: str, n_asv: int, n_samples: int, sparsity: float,
+                  seed: int = 0, domain: str = "BAC") -> Dict[str, str]:
+    """Generate one dataset under `root`. Returns {kind: path}."""
+    rng = np.random.default_rng(seed)
+    domain_name = "Archaea" if domain == "ARC" else "Bacteria"
+
+    lineages = make_lineages(n_asv, rng, domain=domain_name)
+    counts = make_counts(n_asv, n_samples, sparsity, rng)
+    meta = make_metadata(n_samples, rng, domain=domain)
+    sids = meta["sampleid"].tolist()
+
+    result_dir = os.path.join(root, "result", domain)
+    fastq_dir = os.path.join(root, "fastq")
+    organized_dir = os.path.join(root, "qiime2", "taxa-organized")
+    for d in (result_dir, fastq_dir, organized_dir):
+        os.makedirs(d, exist_ok=True)
+    paths = {
+        "level7": os.path.join(result_dir, "level-7.csv"),
+        "taxonomy": os.path.join(result_dir, "metadata.tsv"),
+        "metadata": os.path.join(fastq_dir, f"sample-metadata-{domain.lower()}.tsv"),
+        "organized": os.path.join(organized_dir, f"synthetic-{domain}.xlsx"),
+        "cwd": os.path.join(root, "qiime2"),
+    }
+
+    # sample metadata
+    meta.to_csv(paths["metadata"], sep="\t", index=False)
+
+    # taxonomy TSV (per ASV, with the q2 types row)
+    feature_ids = [rng.bytes(16).hex() for _ in range(n_asv)]
+    taxonomy = pd.DataFrame({
+        "Feature ID": ["#q2:types"] + feature_ids,
+        "Taxon": ["categorical"] + lineages,
+        "Confidence": ["numeric"] + [f"{c:.4f}" for c in rng.uniform(0.7, 1.0, n_asv)],
+    })
+    taxonomy.to_csv(paths["taxonomy"], sep="\t", index=False)
+
+    # level-7 barplot CSV: collapsed by lineage, samples as rows, metadata columns at the end
+    collapsed = pd.DataFrame(counts, index=lineages, columns=sids).groupby(level=0, sort=False).sum()
+    level7 = collapsed.T
+    level7.index.name = "index"
+    level7["site"] = meta["site"].values
+    level7["round"] = meta["round"].values
+    level7.to_csv(paths["level7"])
+
+    # taxa-organized workbook, built with the same helpers as taxa_organizer
+    otus = build_otus(split_lineage(collapsed), taxonomy)
+    with pd.ExcelWriter(paths["organized"], engine="xlsxwriter") as writer:
+        otus.to_excel(writer, sheet_name="OTUs")
+        for sheet, df in build_organized_sheets(otus).items():
+            df.to_excel(writer, sheet_name=sheet)
+    return paths
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--asvs", type=int, default=1000)
+    ap.add_argument("--samples", type=int, default=100)
+    ap.add_argument("--sparsity", type=float, default=0.8)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--domain", default="BAC", choices=["ARC", "BAC"])
+    ap.add_argument("--out", required=True)
+    args = ap.parse_args()
+    paths = write_dataset(args.out, args.asvs, args.samples, args.sparsity, args.seed, args.domain)
+    for kind, path in paths.items():
+        print(f"{kind:<10} {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -8,6 +8,7 @@ Created on Wed Dec 14 12:44:16 2022
 import pandas as pd
 import os
 import numpy as np
+from functions.Metadata import SampleMetadata
 
 #fastq directory
 ARC = '../fastq/ARC'
@@ -37,6 +38,8 @@ def metadata(domain):
                 categories[col].append(features[i-1])
         else: continue
     metadata = pd.DataFrame(categories)
+    #duplicate sample names (e.g. several lanes) / sites missing from SITE_ORDER_BASE
+    SampleMetadata(metadata).report()
     return metadata
 domain = input("input domain that you want to create metadata for (ARC / BAC):")
 if domain == "ARC":
@@ -0,0 +1,151 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Upper bound (bytes) for the (block x block x taxa-chunk) temporaries of all workers together
+# in the Bray-Curtis kernel: each worker gets MEMORY_BUDGET_BYTES / n_jobs
+MEMORY_BUDGET_BYTES = 128 * 1024 * 1024
+# Default worker count (more cores only add memory, the kernels are memory-bound)
+MAX_DEFAULT_JOBS = 4
+DEFAULT_BLOCK_SIZE = 256
+METRICS = ("braycurtis", "jaccard")
+
+
+def _block_bounds(n: int, block_size: int) -> List[Tuple[int, int]]:
+    """Split range(n) into [start, stop) pairs of at most block_size."""
+    return [(a, min(a + block_size, n)) for a in range(0, n, block_size)]
+
+
+def _braycurtis_block(X: np.ndarray, row_sums: np.ndarray,
+                      i0: int, i1: int, j0: int, j1: int,
+                      taxa_chunk: int) -> np.ndarray:
+    """
+    Bray-Curtis dissimilarity between samples X[i0:i1] and X[j0:j1].
+    sum|u - v| = sum(u) + sum(v) - 2 * sum(min(u, v)); the min-sum is
+    accumulated over taxa chunks so the temporary stays bounded.
+    """
+    shared = np.zeros((i1 - i0, j1 - j0), dtype=np.float64)
+    for t0 in range(0, X.shape[1], taxa_chunk):
+        t1 = min(t0 + taxa_chunk, X.shape[1])
+        a = X[i0:i1, None, t0:t1]
+        b = X[None, j0:j1, t0:t1]
+        shared += np.minimum(a, b).sum(axis=2)
+
+    denom = row_sums[i0:i1, None] + row_sums[None, j0:j1]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        d = 1.0 - 2.0 * shared / denom
+    # two empty samples are identical
+    d[denom == 0] = 0.0
+    return np.clip(d, 0.0, 1.0)
+
+
+def _jaccard_block(P: np.ndarray, counts: np.ndarray,
+                   i0: int, i1: int, j0: int, j1: int) -> np.ndarray:
+    """Jaccard distance on presence/absence between samples P[i0:i1] and P[j0:j1]."""
+    inter = P[i0:i1] @ P[j0:j1].T
+    union = counts[i0:i1, None] + counts[None, j0:j1] - inter
+    with np.errstate(invalid="ignore", divide="ignore"):
+        d = 1.0 - inter / union
+    d[union == 0] = 0.0
+    return d
+
+
+def pairwise_distances(X: np.ndarray, metric: str = "braycurtis",
+                       block_size: int = DEFAULT_BLOCK_SIZE,
+                       n_jobs: int = None) -> np.ndarray:
+    """
+    Blocked pairwise distance matrix between the rows (samples) of X.
+
+    - X is samples x taxa (counts or relative abundances).
+    - Only upper-triangle blocks are computed; the lower triangle is mirrored.
+    - Blocks are dispatched to a thread pool (NumPy releases the GIL inside
+      the kernels). n_jobs defaults to min(cpu count, MAX_DEFAULT_JOBS); the block
+      temporaries of all workers stay within MEMORY_BUDGET_BYTES, plus the n x n result.
+    """
+    if metric not in METRICS:
+        raise ValueError(f"Unknown metric '{metric}'. Choose from {METRICS}.")
+
+    X = np.asarray(X, dtype=np.float64)
+    X = np.nan_to_num(X, nan=0.0)
+    n = X.shape[0]
+    out = np.zeros((n, n), dtype=np.float64)
+    if n == 0:
+        return out
+    n_jobs = n_jobs or min(os.cpu_count() or 1, MAX_DEFAULT_JOBS)
+
+    if metric == "braycurtis":
+        row_sums = X.sum(axis=1)
+        per_taxon = max(block_size * block_size * 8, 1)
+        taxa_chunk = max(1, min(X.shape[1], MEMORY_BUDGET_BYTES // n_jobs // per_taxon))
+
+        def kernel(i0, i1, j0, j1):
+            return _braycurtis_block(X, row_sums, i0, i1, j0, j1, taxa_chunk)
+    else:
+        P = (X > 0).astype(np.float64)
+        counts = P.sum(axis=1)
+
+        def kernel(i0, i1, j0, j1):
+            return _jaccard_block(P, counts, i0, i1, j0, j1)
+
+    bounds = _block_bounds(n, block_size)
+    tasks = [(bi, bj) for k, bi in enumerate(bounds) for bj in bounds[k:]]
+
+    def run(task):
+        (i0, i1), (j0, j1) = task
+        return task, kernel(i0, i1, j0, j1)
+
+    with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+        for ((i0, i1), (j0, j1)), block in pool.map(run, tasks):
+            out[i0:i1, j0:j1] = block
+            out[j0:j1, i0:i1] = block.T
+
+    np.fill_diagonal(out, 0.0)
+    return out
+
+
+def distance_matrix_from_rank_table(rank_df: pd.DataFrame, metric: str = "braycurtis",
+                                    block_size: int = DEFAULT_BLOCK_SIZE,
+                                    n_jobs: int = None) -> pd.DataFrame:
+    """
+    Distance matrix between samples of a rank table (taxa rows x sample columns,
+    e.g. the 'G_read' sheet). Non-numeric columns are ignored.
+    """
+    reads = rank_df.apply(pd.to_numeric, errors="coerce").dropna(axis=1, how="all").fillna(0)
+    samples = [str(c) for c in reads.columns]
+    d = pairwise_distances(reads.to_numpy().T, metric=metric,
+                           block_size=block_size, n_jobs=n_jobs)
+    return pd.DataFrame(d, index=samples, columns=samples)
+
+
+def distance_sheet_name(read_sheet: str, metric: str) -> str:
+    """'G_read' + 'braycurtis' -> 'G_braycurtis'."""
+    return f"{read_sheet.split('_', 1)[0]}_{metric}"
+
+
+def write_distance_matrices(matrices: Dict[str, pd.DataFrame], file: str, fmt: str = "xlsx") -> str:
+    """
+    Write {sheet_name: distance DataFrame}.
+      - 'xlsx': appended as extra sheets of the organized workbook `file`
+      - 'npz' : one compressed file next to it (<file>_distances.npz) holding
+                a '<sheet>' matrix and its '<sheet>__samples' labels per sheet
+    Returns the path written.
+    """
+    if fmt == "xlsx":
+        with pd.ExcelWriter(file, mode="a", engine="openpyxl", if_sheet_exists="replace") as writer:
+            for sheet, dm in matrices.items():
+                dm.to_excel(writer, sheet_name=sheet)
+        return file
+
+    if fmt == "npz":
+        path = os.path.splitext(file)[0] + "_distances.npz"
+        arrays = {}
+        for sheet, dm in matrices.items():
+            arrays[sheet] = dm.to_numpy(dtype=np.float32)
+            arrays[f"{sheet}__samples"] = np.asarray(dm.index, dtype=str)
+        np.savez_compressed(path, **arrays)
+        return path
+
+    raise ValueError(f"Unknown output format '{fmt}'. Use 'xlsx' or 'npz'.")
@@ -0,0 +1,170 @@
+import re
+import pandas as pd
+from typing import Dict, List
+from functions.Metadata import SampleMetadata
+from functions.OrganizeHelper import reads_to_percent, drop_minor
+from functions.ProcessHelper import find_read_sheet_name
+from functions.StageProfiler import stage
+
+DOMAINS = ["ARC", "BAC"]
+COMBINED = "ALL"
+RATIO_SHEET = "ARC_BAC_ratio"
+# temporary metadata column holding the pair key (see load_union_metadata)
+_PAIR_COL = "__pair_key"
+
+def domain_pair_key(sample_id: str, domain: str) -> str:
+    """
+    Sample ID without its domain token, shared by the ARC and BAC libraries of one sample:
+    'CJU-0d-ARC' -> 'CJU-0d', 'DGGB-r3-BAC-0007' -> 'DGGB-r3-0007' (IDs without the token are kept).
+    """
+    key = re.sub(rf"(^|[-_.]){domain}(?=$|[-_.])", "", str(sample_id), flags=re.IGNORECASE).strip("-_.")
+    return key or str(sample_id)
+
+def load_union_metadata(paths: Dict[str, str], pair_key: str = "", sampleid_col: str = "sampleid"):
+    """
+    Read and check each domain's metadata TSV once and stack them (union of columns, '' where missing).
+    Returns (meta, pair_ids): the SampleMetadata of both domains and {domain: {sampleid -> pair key}}.
+
+    ARC and BAC libraries of one sample are paired on their sample ID without the domain token
+    (domain_pair_key), or on the metadata column pair_key when given.
+    For every pair key that is not a sample ID, one row is appended (sampleid = key, other columns
+    from its first sample) so the combined sheets get header rows and a place in the global sample order.
+    The pair column itself is dropped: the sheets expect the usual description rows only.
+    """
+    frames = []
+    pair_ids = {}
+    for domain, path in paths.items():
+        with stage("read metadata") as st:
+            domain_meta = SampleMetadata.read(path, sampleid_col)
+            st.shape(domain_meta.frame)
+        print(f"{domain} metadata: {len(domain_meta)} samples")
+        domain_meta.report()
+        frame = domain_meta.frame
+        if pair_key:
+            if pair_key not in frame.columns:
+                raise ValueError(f"{domain} metadata is missing the pair column '{pair_key}'.")
+            keys = frame[pair_key].astype(str)
+            if pair_key != sampleid_col:
+                frame = frame.drop(columns=[pair_key])
+        else:
+            keys = frame[sampleid_col].map(lambda s: domain_pair_key(s, domain))
+        pair_ids[domain] = dict(zip(frame[sampleid_col], keys))
+        frames.append(frame.assign(**{_PAIR_COL: keys.to_numpy()}))
+
+    meta = pd.concat(frames, ignore_index=True).fillna("")
+    keyed = meta.drop_duplicates(subset=[_PAIR_COL], keep="first").copy()
+    keyed[sampleid_col] = keyed[_PAIR_COL]
+    meta = pd.concat([meta, keyed], ignore_index=True).drop(columns=[_PAIR_COL])
+    # same sample ID in both domains = one sample (first row kept)
+    meta = meta.drop_duplicates(subset=[sampleid_col], keep="first").reset_index(drop=True)
+    return SampleMetadata(meta, sampleid_col), pair_ids
+
+def paired_keys(pair_ids: Dict[str, Dict[str, str]], global_sample_order: List[str]) -> List[str]:
+    """
+    Pair keys present in every domain, in the global sample order
+    (keys are sample IDs, or have their own metadata row, see load_union_metadata).
+    """
+    common = set.intersection(*(set(ids.values()) for ids in pair_ids.values()))
+    ordered = [k for k in global_sample_order if k in common]
+    return ordered + sorted(common.difference(ordered))
+
+def _by_key(table: pd.DataFrame, ids: Dict[str, str], keys: List[str]) -> pd.DataFrame:
+    """Sample columns -> pair key columns (libraries sharing a key are summed), missing keys = 0."""
+    cols = [c for c in table.columns if c in ids]
+    out = table[cols].T.groupby([ids[c] for c in cols], sort=False).sum().T
+    return out.reindex(columns=keys, fill_value=0)
+
+def combine_read_tables(read_dfs: Dict[str, pd.DataFrame], pair_ids: Dict[str, Dict[str, str]],
+                        keys: List[str]) -> pd.DataFrame:
+    """
+    Per-domain *_read sheets -> one read table over both domains, one column per pair key.
+    Labels found in both domains (e.g. 'unidentified') are summed.
+    """
+    label_col = next(iter(read_dfs.values())).columns[0]
+    parts = [_by_key(read_df.set_index(read_df.columns[0]), pair_ids[d], keys) for d, read_df in read_dfs.items()]
+    combined = pd.concat(parts).groupby(level=0).sum()
+    combined.index.name = label_col
+    return combined
+
+def combined_rank_sheets(read_dfs: Dict[str, pd.DataFrame], pair_ids: Dict[str, Dict[str, str]],
+                         keys: List[str]):
+    """
+    Combined rank(%) / *_read sheets, laid out like the parsed workbook sheets.
+    Percentages are of the pooled ARC + BAC reads of each sample. Returns (df, read_df).
+    """
+    reads = combine_read_tables(read_dfs, pair_ids, keys)
+    rank = drop_minor(reads_to_percent(reads))
+    return rank.reset_index(), reads.reset_index()
+
+def domain_totals(read_df: pd.DataFrame) -> pd.Series:
+    """Total reads per sample of one domain (sum over all taxa of a *_read sheet)."""
+    return read_df.iloc[:, 1:].sum(axis=0, numeric_only=True)
+
+def ratio_table(totals: Dict[str, pd.Series], pair_ids: Dict[str, Dict[str, str]], keys: List[str]) -> pd.DataFrame:
+    """
+    Archaea : bacteria reads per paired sample, one column per pair key:
+    'ARC reads', 'BAC reads', 'ARC:BAC' (blank if no BAC reads), 'ARC (%)' of both.
+    """
+    per_key = {d: _by_key(totals[d].to_frame().T, pair_ids[d], keys).iloc[0] for d in DOMAINS}
+    arc, bac = per_key["ARC"], per_key["BAC"]
+    both = arc + bac
+    rows = [
+        ("ARC reads", arc),
+        ("BAC reads", bac),
+        ("ARC:BAC", (arc / bac.where(bac != 0)).round(3)),
+        ("ARC (%)", (arc / both.where(both != 0) * 100).round(2)),
+    ]
+    return pd.DataFrame([{"Domain": label, **s.to_dict()} for label, s in rows], columns=["Domain"] + keys)
+
+class DomainWorkbooks:
+    """
+    The ARC and BAC taxa-organized workbooks as one sheet source for the sheet pipeline:
+        process_sheets_pipelined(workbooks, workbooks.sheet_names, ..., read_pair=workbooks.read_pair)
+
+    Per rank(%) sheet, the output sheets are '<sheet>_ARC', '<sheet>_BAC' and, when both domains
+    have it and samples pair up, '<sheet>_ALL'. Every sheet is parsed once: the *_read sheets of
+    a rank are kept until its combined sheet is built from them.
+    """
+
+    def __init__(self, paths: Dict[str, str], pair_ids: Dict[str, Dict[str, str]], keys: List[str]):
+        self.xfs = {d: pd.ExcelFile(p) for d, p in paths.items()}
+        self.pair_ids = pair_ids
+        self.keys = keys
+        self.totals: Dict[str, pd.Series] = {}
+        self._reads = {}
+        self.sheet_names = self._plan()
+
+    def _plan(self) -> List[str]:
+        ranks = []
+        for xf in self.xfs.values():
+            ranks += [s for s in xf.sheet_names if "rank(%)" in s and s not in ranks]
+        out = []
+        for s in ranks:
+            domains = [d for d, xf in self.xfs.items() if s in xf.sheet_names]
+            out += [f"{s}_{d}" for d in domains]
+            if len(domains) == len(self.xfs) > 1 and self.keys:
+                out.append(f"{s}_{COMBINED}")
+        return out
+
+    def read_pair(self, sheet: str):
+        """Output sheet name -> (df, read_df), as read_sheet_pair does for one workbook."""
+        base, tag = sheet.rsplit("_", 1)
+        read_sheet = find_read_sheet_name(base)
+        if tag == COMBINED:
+            read_dfs = {d: self._reads.pop((d, read_sheet)) for d in self.xfs}
+            with stage("combine domains") as st:
+                df, read_df = combined_rank_sheets(read_dfs, self.pair_ids, self.keys)
+                st.shape(df)
+            return df, read_df
+
+        with stage("parse sheet") as st:
+            df = self.xfs[tag].parse(base)
+            st.shape(df)
+        with stage("parse read sheet") as st:
+            read_df = self.xfs[tag].parse(read_sheet)
+            st.shape(read_df)
+        if tag not in self.totals:
+            self.totals[tag] = domain_totals(read_df)
+        if f"{base}_{COMBINED}" in self.sheet_names:
+            self._reads[(tag, read_sheet)] = read_df
+        return df, read_df
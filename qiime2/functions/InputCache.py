@@ -0,0 +1,104 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Tuple
+
+import pandas as pd
+from functions.Metadata import SampleMetadata
+from functions.ProcessSheet import read_sheet_pair, list_target_sheets
+from functions.StageProfiler import stage
+
+def file_key(path: str) -> Tuple[str, int, int]:
+    """(absolute path, mtime, size): a file changed on disk gets a new cache entry."""
+    st = os.stat(path)
+    return os.path.abspath(path), st.st_mtime_ns, st.st_size
+
+class ParsedWorkbook:
+    """
+    A taxa-organized workbook whose rank(%) / *_read sheet pairs are parsed on first use and kept:
+        process_sheets_pipelined(wb, sheets, ..., read_pair=wb.read_pair)
+    The sheet pipeline never modifies the parsed frames, so they are shared by every run.
+    The file handle is closed as soon as every rank(%) sheet has been parsed.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.xf = pd.ExcelFile(path)
+        self.sheet_names = self.xf.sheet_names
+        self._pairs = {}
+        self._unparsed = set(list_target_sheets(self))
+        self._lock = threading.Lock()
+
+    def read_pair(self, sheet: str):
+        """(df, read_df) of a rank(%) sheet, parsed once (see read_sheet_pair)."""
+        with self._lock:
+            if sheet not in self._pairs:
+                if self.xf is None:
+                    self.xf = pd.ExcelFile(self.path)
+                self._pairs[sheet] = read_sheet_pair(self.xf, sheet)
+                self._unparsed.discard(sheet)
+                if not self._unparsed:
+                    self._close_file()
+            return self._pairs[sheet]
+
+    def _close_file(self):
+        if self.xf is not None:
+            self.xf.close()
+            self.xf = None
+
+    def close(self):
+        self._pairs.clear()
+        self._close_file()
+
+class InputCache:
+    """
+    Parsed workbooks and SampleMetadata kept between runs (organizer_worker.py).
+    At most `size` files are held: the least recently used one is dropped first, and an evicted
+    (or replaced, or cleared) workbook is closed. get_*() return (value, hit).
+    """
+
+    def __init__(self, size: int = 4):
+        self.size = size
+        self._items: "OrderedDict[Tuple, object]" = OrderedDict()
+
+    def _get(self, kind: str, path: str, load):
+        key = (kind, *file_key(path))
+        if key in self._items:
+            self._items.move_to_end(key)
+            return self._items[key], True
+        # an older version of the same file is dropped right away
+        for old in [k for k in self._items if k[:2] == key[:2]]:
+            self._evict(old)
+        value = load(path)
+        self._items[key] = value
+        while len(self._items) > self.size:
+            self._evict(next(iter(self._items)))
+        return value, False
+
+    def _evict(self, key):
+        value = self._items.pop(key)
+        if isinstance(value, ParsedWorkbook):
+            value.close()
+
+    def get_workbook(self, path: str):
+        with stage("open workbook"):
+            return self._get("workbook", path, ParsedWorkbook)
+
+    def get_metadata(self, path: str):
+        def load(p):
+            with stage("read metadata") as st:
+                meta = SampleMetadata.read(p)
+                st.shape(meta.frame)
+            return meta
+        return self._get("metadata", path, load)
+
+    def entries(self):
+        """Cached files, oldest first: [{'kind', 'path', 'sheets'}]."""
+        return [{"kind": k[0], "path": k[1],
+                 "sheets": len(v._pairs) if isinstance(v, ParsedWorkbook) else None,
+                 "open": v.xf is not None if isinstance(v, ParsedWorkbook) else None}
+                for k, v in self._items.items()]
+
+    def clear(self):
+        for key in list(self._items):
+            self._evict(key)
@@ -0,0 +1,173 @@
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Sequence, Tuple
+
+LINEAGE_COLUMNS = ['Domain', 'Phylum', 'Class', 'Order', 'Family', 'Genus', 'Species']
+UNIDENTIFIED_KEYS = ['uncultured', 'unidentified', 'Ambiguous', 'metagenome', 'Unknown', 'group']
+
+
+def parse_lineages(lineages: Sequence[str]) -> np.ndarray:
+    """
+    'D_0__Bacteria;D_1__...;D_6__...' strings -> (n, 7) array of labels (Domain..Species).
+    Labels containing any of UNIDENTIFIED_KEYS, empty or missing become 'unidentified'.
+    """
+    s = pd.Series(lineages, dtype=object).astype(str)
+    parts = s.str.split(";")
+    pattern = '|'.join(UNIDENTIFIED_KEYS)
+    out = np.empty((len(s), len(LINEAGE_COLUMNS)), dtype=object)
+    for i in range(len(LINEAGE_COLUMNS)):
+        labels = parts.str.get(i).str.split('__').str[1].replace('', np.nan)
+        unid = labels.isna() | labels.astype(str).str.contains(pattern, regex=True)
+        out[:, i] = labels.where(~unid, 'unidentified').to_numpy()
+    return out
+
+
+def _csr(codes: np.ndarray, n_groups: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Rows grouped by code: rows of group g are order[offsets[g]:offsets[g + 1]]."""
+    order = np.argsort(codes, kind='stable')
+    offsets = np.zeros(n_groups + 1, dtype=np.int64)
+    np.cumsum(np.bincount(codes, minlength=n_groups), out=offsets[1:])
+    return order, offsets
+
+
+class LineageIndex:
+    """
+    Integer-coded taxonomy over the observed lineage rows (ASVs / level-7 rows),
+    built once per run and shared by the organizer stages.
+
+    Per rank r (0 = Domain .. 6 = Species):
+      - label_codes[:, r]  row -> code into rank_labels[r] (sorted, same order as a pandas groupby)
+      - path_codes[:, r]   row -> trie node at rank r (unique Domain..rank path)
+      - parent[r]          trie node at rank r -> its node at rank r - 1 (-1 for Domain)
+      - node_label[r]      trie node -> label code
+    Rows sharing a label / a node are stored contiguously (CSR), so roll-ups are one
+    reduceat and "all rows under X" is a slice.
+    """
+
+    def __init__(self, labels: np.ndarray):
+        labels = np.asarray(labels, dtype=object)
+        self.n_rows, self.n_ranks = labels.shape
+        self.label_codes = np.empty(labels.shape, dtype=np.int64)
+        self.path_codes = np.empty(labels.shape, dtype=np.int64)
+        self.rank_labels: List[np.ndarray] = []
+        self.parent: List[np.ndarray] = []
+        self.node_label: List[np.ndarray] = []
+        self._label_code: List[Dict[str, int]] = []
+        self._label_csr = []
+        self._node_csr = []
+        self._child: List[Dict[Tuple[int, int], int]] = []
+
+        parent_nodes = np.zeros(self.n_rows, dtype=np.int64)
+        for r in range(self.n_ranks):
+            uniq, inv = np.unique(labels[:, r].astype(str), return_inverse=True)
+            inv = inv.reshape(-1)
+            self.label_codes[:, r] = inv
+            self.rank_labels.append(uniq)
+            self._label_code.append({lab: i for i, lab in enumerate(uniq)})
+            self._label_csr.append(_csr(inv, len(uniq)))
+
+            # trie node = (parent node, label) pair
+            keys = parent_nodes * len(uniq) + inv
+            node_keys, nodes = np.unique(keys, return_inverse=True)
+            nodes = nodes.reshape(-1)
+            self.path_codes[:, r] = nodes
+            self.parent.append(node_keys // len(uniq) if r else np.full(len(node_keys), -1))
+            self.node_label.append(node_keys % len(uniq))
+            self._node_csr.append(_csr(nodes, len(node_keys)))
+            self._child.append({(int(k // len(uniq)), int(k % len(uniq))): n for n, k in enumerate(node_keys)})
+            parent_nodes = nodes
+
+    @classmethod
+    def from_lineages(cls, lineages: Sequence[str]) -> "LineageIndex":
+        """From 'D_0__...;D_6__...' strings (parsed once, see parse_lineages)."""
+        return cls(parse_lineages(lineages))
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, columns: Sequence[str] = LINEAGE_COLUMNS) -> "LineageIndex":
+        """From a frame that already holds the Domain..Species label columns."""
+        return cls(df[list(columns)].astype(str).to_numpy(dtype=object))
+
+    def rank_of(self, rank) -> int:
+        """Rank position from an int or a column name ('Genus')."""
+        return LINEAGE_COLUMNS.index(rank) if isinstance(rank, str) else int(rank)
+
+    def labels(self, rank) -> np.ndarray:
+        """Label of every row at `rank`."""
+        r = self.rank_of(rank)
+        return self.rank_labels[r][self.label_codes[:, r]]
+
+    def rollup(self, values, rank) -> pd.DataFrame:
+        """
+        Sum rows per label at `rank` (same result and order as values.groupby(labels).sum()).
+        `values` is an (n_rows x samples) DataFrame or array; NaN counts as 0, integer counts stay integer.
+        """
+        r = self.rank_of(rank)
+        columns = values.columns if isinstance(values, pd.DataFrame) else None
+        arr = np.asarray(values)
+        index = pd.Index(self.rank_labels[r], name=LINEAGE_COLUMNS[r])
+        if arr.dtype.kind in 'iub' and self.n_rows:
+            order, offsets = self._label_csr[r]
+            summed = np.add.reduceat(arr.astype(np.int64)[order], offsets[:-1], axis=0)
+            return pd.DataFrame(summed, index=index, columns=columns)
+        # floats: pandas' compensated group sum over the integer codes keeps results
+        # bit-identical to the string groupby
+        summed = pd.DataFrame(arr.astype(np.float64)).groupby(self.label_codes[:, r]).sum()
+        summed = summed.reindex(range(len(index)), fill_value=0.0).to_numpy()
+        return pd.DataFrame(summed, index=index, columns=columns)
+
+    def rows_with_label(self, rank, label: str) -> np.ndarray:
+        """Row positions whose label at `rank` is `label` (empty if unknown)."""
+        r = self.rank_of(rank)
+        code = self._label_code[r].get(label)
+        if code is None:
+            return np.empty(0, dtype=np.int64)
+        order, offsets = self._label_csr[r]
+        return order[offsets[code]:offsets[code + 1]]
+
+    def node_of(self, path: Sequence[str]) -> int:
+        """Trie node of a Domain..rank path, e.g. ('Bacteria', 'Firmicutes'); -1 if absent."""
+        node = 0
+        for r, label in enumerate(path):
+            code = self._label_code[r].get(label)
+            node = self._child[r].get((node, code), -1) if code is not None else -1
+            if node < 0:
+                return -1
+        return node
+
+    def rows_under(self, path: Sequence[str]) -> np.ndarray:
+        """Row positions (ASVs) in the clade given by a Domain..rank path."""
+        node = self.node_of(path)
+        if node < 0:
+            return np.empty(0, dtype=np.int64)
+        order, offsets = self._node_csr[len(path) - 1]
+        return order[offsets[node]:offsets[node + 1]]
+
+    def lineage(self, row: int) -> Tuple[str, ...]:
+        """Domain..Species labels of one row."""
+        return tuple(self.rank_labels[r][self.label_codes[row, r]] for r in range(self.n_ranks))
+
+
+class LabelIndex:
+    """
+    label -> row positions of a sheet's taxonomy/label column (stripped strings),
+    built once per sheet instead of scanning the column for every lookup.
+    """
+
+    def __init__(self, labels):
+        self._rows: Dict[str, List[int]] = {}
+        self.n_rows = 0
+        self.extend(labels)
+
+    def extend(self, labels) -> "LabelIndex":
+        """Add rows appended below the indexed ones (e.g. the ranking rows)."""
+        for pos, lab in enumerate(pd.Series(labels).astype(str).str.strip(), start=self.n_rows):
+            self._rows.setdefault(lab, []).append(pos)
+        self.n_rows += len(labels)
+        return self
+
+    def rows(self, label: str) -> List[int]:
+        return self._rows.get(str(label).strip(), [])
+
+    def first(self, label: str, default=None):
+        rows = self.rows(label)
+        return rows[0] if rows else default
@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Sequence
+from functions.config import SITE_ORDER_BASE
+
+UNLISTED_RANK = 10**9  # sort rank of values missing from a sort spec (sorted last)
+
+class SampleMetadata:
+    """
+    Sample metadata (sampleid + description columns such as site / round), loaded once per run
+    and shared by every stage (site header rows, sort prompts, global sample order).
+
+    - values are strings (as read with dtype=str; missing values become 'nan' as before),
+    - duplicate sample IDs keep their first row (listed in .duplicates, see report()),
+    - description columns are categoricals indexed by sampleid, so lookups for a whole
+      sheet of sample columns are a single reindex instead of per-sample dict gets.
+    """
+
+    def __init__(self, df: pd.DataFrame, sampleid_col: str = "sampleid"):
+        if sampleid_col not in df.columns:
+            raise ValueError(f"Metadata is missing required column '{sampleid_col}'.")
+        df = df.astype(str)
+        dup = df[sampleid_col].duplicated(keep="first")
+        self.duplicates: List[str] = df.loc[dup, sampleid_col].unique().tolist()
+        self.frame = df[~dup].reset_index(drop=True)
+        self.sampleid_col = sampleid_col
+        self.columns: List[str] = [c for c in self.frame.columns if c != sampleid_col]
+        self.sample_ids: List[str] = self.frame[sampleid_col].tolist()
+        self._by_sid = self.frame.set_index(sampleid_col)[self.columns].astype("category")
+
+    @classmethod
+    def read(cls, path: str, sampleid_col: str = "sampleid") -> "SampleMetadata":
+        """Metadata TSV (sample-metadata-<domain>.tsv)."""
+        return cls(pd.read_csv(path, sep="\t", dtype=str), sampleid_col)
+
+    def __len__(self) -> int:
+        return len(self.sample_ids)
+
+    def unique(self, column: str) -> List[str]:
+        """Distinct values of a column, in order of appearance."""
+        return self.frame[column].unique().tolist()
+
+    def lookup(self, column: str, sample_ids: Sequence, default: str = "") -> np.ndarray:
+        """Value of `column` for each sample ID (`default` for IDs without metadata)."""
+        values = self._by_sid[column].reindex(pd.Index(sample_ids, dtype=object))
+        return values.astype(object).where(values.notna(), default).to_numpy(dtype=object)
+
+    def rank_codes(self, column: str, order: Sequence[str]) -> np.ndarray:
+        """
+        Position of each sample's value in `order` (sample_ids order), UNLISTED_RANK if not listed.
+        Computed once per category, then broadcast with the category codes.
+        """
+        v2r = {v: i for i, v in enumerate(order)}
+        col = self._by_sid[column]
+        cat_rank = np.array([v2r.get(c, UNLISTED_RANK) for c in col.cat.categories] + [UNLISTED_RANK], dtype=np.int64)
+        return cat_rank[col.cat.codes.to_numpy()]
+
+    def validate(self, table_samples: Sequence = None, site_col: str = "site") -> Dict[str, List[str]]:
+        """
+        Problems that would otherwise pass silently:
+          duplicate_ids           sampleid listed more than once (first row kept)
+          missing_from_table      metadata samples not in the table / sheet
+          missing_from_metadata   table samples without metadata (blank header rows, sorted last)
+          unknown_sites           sites not in SITE_ORDER_BASE (appended after the known sites)
+        """
+        issues = {"duplicate_ids": list(self.duplicates)}
+        if table_samples is not None:
+            table = [str(c) for c in table_samples]
+            table_set, meta_set = set(table), set(self.sample_ids)
+            issues["missing_from_table"] = [s for s in self.sample_ids if s not in table_set]
+            issues["missing_from_metadata"] = [s for s in table if s not in meta_set]
+        if site_col in self.columns:
+            known = set(SITE_ORDER_BASE)
+            issues["unknown_sites"] = [s for s in self.unique(site_col) if s not in known]
+        return {k: v for k, v in issues.items() if v}
+
+    def report(self, table_samples: Sequence = None, site_col: str = "site", limit: int = 10) -> Dict[str, List[str]]:
+        """validate() and print each problem once (first `limit` values). Returns the issues."""
+        issues = self.validate(table_samples, site_col)
+        for kind, values in issues.items():
+            shown = ", ".join(values[:limit]) + (" ..." if len(values) > limit else "")
+            print(f"metadata check - {kind.replace('_', ' ')} ({len(values)}): {shown}")
+        return issues
+
+def as_metadata(meta, sampleid_col: str = "sampleid") -> SampleMetadata:
+    """SampleMetadata as is, or built from a metadata DataFrame (for callers holding a plain frame)."""
+    if isinstance(meta, SampleMetadata):
+        return meta
+    return SampleMetadata(meta, sampleid_col)
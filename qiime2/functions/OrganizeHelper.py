@@ -0,0 +1,249 @@
+import os
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Tuple
+from functions.LineageIndex import LINEAGE_COLUMNS, LineageIndex, parse_lineages
+
+Number = range(1, 7)
+Name = ['P_read', 'C_read', 'O_read', 'F_read', 'G_read', 'S_read']
+Name_per = ['P(%)', 'C(%)', 'O(%)', 'F(%)', 'G(%)', 'S(%)']
+Name_major = ['P_rank(%)', 'C_rank(%)', 'O_rank(%)', 'F_rank(%)', 'G_rank(%)', 'S_rank(%)']
+Number_name = list(zip(Number, Name, Name_per, Name_major))
+
+
+def split_lineage(data: pd.DataFrame) -> pd.DataFrame:
+    """
+    Split the 'D_0__...;D_1__...' index of a level-7 table into the 7 lineage
+    columns (Domain..Species) in front of the sample columns.
+    Labels containing any of UNIDENTIFIED_KEYS (or empty) become 'unidentified'.
+    The lineage string is kept in an 'index' column ('; ' separated).
+    """
+    data = data.copy()
+    labels = parse_lineages(data.index)
+    for i, col in enumerate(LINEAGE_COLUMNS):
+        data.insert(i, col, labels[:, i])
+
+    data.reset_index(inplace=True)
+    data['index'] = data['index'].astype(str).str.replace(';', '; ', regex=False)
+    return data
+
+
+def reads_to_percent(reads: pd.DataFrame) -> pd.DataFrame:
+    """Per-sample relative abundance (%) of each row, rounded to 3 decimals."""
+    return (reads.div(reads.sum(axis=0), axis=1) * 100).round(3)
+
+
+def drop_minor(df: pd.DataFrame, threshold: float = 1) -> pd.DataFrame:
+    """Drop rows whose maximum over all samples is below threshold (%)."""
+    return df[~(df.max(axis=1) < threshold)]
+
+
+def build_rank_sheets(lineage_df: pd.DataFrame, rank_col: str, sample_cols: List[str],
+                      index: LineageIndex = None):
+    """
+    Aggregate lineage rows to one rank.
+    `index` is the LineageIndex of lineage_df (built here if not given; pass it when
+    building several ranks from the same rows).
+    Returns (reads, percent, rank) tables indexed by the rank label.
+    """
+    if index is None:
+        index = LineageIndex.from_frame(lineage_df)
+    reads = lineage_df[sample_cols].apply(pd.to_numeric, errors='coerce')
+    per = reads_to_percent(reads)
+    new1 = index.rollup(reads, rank_col)
+    new2 = index.rollup(per, rank_col)
+    return new1, new2, drop_minor(new2)
+
+
+def sample_columns(df: pd.DataFrame) -> List[str]:
+    """Sample columns of a split_lineage() / OTUs frame (everything but the lineage columns)."""
+    return [c for c in df.columns if c not in LINEAGE_COLUMNS and c not in ('index', 'Feature ID')]
+
+
+def representative_ids(raw_lineages: pd.Series, taxonomy: pd.DataFrame = None) -> pd.Series:
+    """
+    'Feature ID' of each level-7 row: the first feature of the taxonomy TSV (Feature ID / Taxon)
+    classified to that lineage, or the lineage string itself when none is (or no TSV is given).
+    """
+    key = raw_lineages.astype(str).str.replace(r';\s*', ';', regex=True)
+    if taxonomy is None:
+        return key
+    tax = taxonomy[taxonomy['Feature ID'] != '#q2:types']
+    first = tax.assign(Taxon=tax['Taxon'].astype(str).str.replace(r';\s*', ';', regex=True)) \
+        .drop_duplicates('Taxon').set_index('Taxon')['Feature ID']
+    return key.map(first).fillna(key)
+
+
+def build_otus(lineage_df: pd.DataFrame, taxonomy: pd.DataFrame = None) -> pd.DataFrame:
+    """
+    OTUs sheet from split_lineage() output: one row per lineage (Domain..Species), indexed by
+    'Feature ID' (see representative_ids). Level-7 rows that end up with the same lineage once
+    'unidentified' labels are normalized are summed, so the lineage is a unique key (append_batch).
+    Used by both the new and the append mode, so an appended batch equals a full rebuild.
+    """
+    samples = sample_columns(lineage_df)
+    otus = lineage_df[LINEAGE_COLUMNS + samples].copy()
+    otus.insert(0, 'Feature ID', representative_ids(lineage_df['index'], taxonomy).to_numpy())
+    return collapse_lineages(otus)
+
+
+def collapse_lineages(otus: pd.DataFrame) -> pd.DataFrame:
+    """Sum OTUs rows sharing a lineage (first Feature ID kept), indexed by 'Feature ID'."""
+    otus = otus.reset_index() if 'Feature ID' not in otus.columns else otus
+    samples = sample_columns(otus)
+    groups = otus.groupby(LINEAGE_COLUMNS, sort=False)
+    out = groups[samples].sum()
+    out.insert(0, 'Feature ID', groups['Feature ID'].first())
+    out = out.reset_index().set_index('Feature ID')
+    return out[LINEAGE_COLUMNS + samples]
+
+
+def build_organized_sheets(otus: pd.DataFrame, samples: List[str] = None,
+                           index: LineageIndex = None) -> Dict[str, pd.DataFrame]:
+    """
+    *_read / *(%) / *_rank(%) sheets (P..S, workbook order) of the `samples` columns of an OTUs table.
+    `index` is the LineageIndex of otus (built here if not given).
+    """
+    samples = samples if samples is not None else sample_columns(otus)
+    if index is None:
+        index = LineageIndex.from_frame(otus)
+    out = {}
+    for i, j, p, r in Number_name:
+        out[j], out[p], out[r] = build_rank_sheets(otus, LINEAGE_COLUMNS[i], samples, index)
+    return out
+
+
+def read_previous_workbook(path: str) -> Dict[str, pd.DataFrame]:
+    """The sheets append_batch needs from a previous workbook: OTUs, *_read and *(%) (not distances)."""
+    return pd.read_excel(path, sheet_name=['OTUs'] + Name + Name_per, index_col=0)
+
+
+def write_organized_workbook(path: str, sheets: Dict[str, pd.DataFrame]) -> str:
+    """
+    Write {sheet_name: table} as df.to_excel(writer, sheet_name) would (index in column A, its name
+    in A1, NaN blank, bold header and index), with xlsxwriter rows instead of pandas' per-cell
+    formatter (about twice as fast on large workbooks).
+    """
+    import xlsxwriter
+    workbook = xlsxwriter.Workbook(path, {'strings_to_numbers': False, 'strings_to_formulas': False,
+                                          'strings_to_urls': False})
+    header = workbook.add_format({'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'})
+    for sheet, df in sheets.items():
+        ws = workbook.add_worksheet(sheet)
+        if df.index.name is not None:
+            ws.write_string(0, 0, str(df.index.name), header)
+        ws.write_row(0, 1, [str(c) for c in df.columns], header)
+        values = df.to_numpy(dtype=object)
+        if df.isna().to_numpy().any():
+            values[pd.isna(values)] = None
+        for r, (label, row) in enumerate(zip(df.index, values.tolist()), start=1):
+            ws.write(r, 0, label, header)
+            ws.write_row(r, 1, row)
+    workbook.close()
+    return path
+
+
+def tables_path(workbook: str) -> str:
+    """Sidecar of an organized workbook: 'taxa-organized/BAC.xlsx' -> 'taxa-organized/BAC.tables.npz'."""
+    return os.path.splitext(workbook)[0] + '.tables.npz'
+
+
+def save_tables(workbook: str, sheets: Dict[str, pd.DataFrame]) -> str:
+    """
+    Save the sheets append_batch needs (OTUs, *_read, *(%)) next to the workbook (tables_path),
+    so the next append loads arrays instead of parsing the xlsx. Per sheet: index (+ name),
+    text columns (the OTUs lineage) and numeric columns with their dtype. Returns the path.
+    """
+    arrays = {}
+    for sheet in ['OTUs'] + Name + Name_per:
+        df = sheets[sheet]
+        text = [c for c in df.columns if df[c].dtype == object]
+        num = [c for c in df.columns if c not in text]
+        arrays[f'{sheet}__index'] = np.asarray(df.index.astype(str), dtype=str)
+        arrays[f'{sheet}__index_name'] = np.asarray(df.index.name or '', dtype=str)
+        arrays[f'{sheet}__text_columns'] = np.asarray(text, dtype=str)
+        arrays[f'{sheet}__text'] = df[text].to_numpy(dtype=str)
+        arrays[f'{sheet}__columns'] = np.asarray([str(c) for c in num], dtype=str)
+        arrays[f'{sheet}__values'] = df[num].to_numpy()
+    path = tables_path(workbook)
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(tmp, path)
+    return path
+
+
+def load_tables(path: str) -> Dict[str, pd.DataFrame]:
+    """Sheets saved by save_tables, as read_previous_workbook returns them."""
+    out = {}
+    with np.load(path, allow_pickle=False) as z:
+        for sheet in ['OTUs'] + Name + Name_per:
+            index = pd.Index(z[f'{sheet}__index'].astype(object), name=str(z[f'{sheet}__index_name']) or None)
+            text = pd.DataFrame(z[f'{sheet}__text'].astype(object), index=index,
+                                columns=z[f'{sheet}__text_columns'].astype(object))
+            values = pd.DataFrame(z[f'{sheet}__values'], index=index, columns=z[f'{sheet}__columns'].astype(object))
+            out[sheet] = pd.concat([text, values], axis=1) if len(text.columns) else values
+    return out
+
+
+def read_previous_tables(workbook: str) -> Tuple[Dict[str, pd.DataFrame], str]:
+    """
+    Previous sheets for append_batch: from the workbook's sidecar (save_tables) when it is at least
+    as new as the workbook, else parsed from the xlsx. Returns (sheets, path read).
+    """
+    path = tables_path(workbook)
+    if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(workbook):
+        return load_tables(path), path
+    return read_previous_workbook(workbook), workbook
+
+
+def append_batch(prev_sheets: Dict[str, pd.DataFrame], new_otus: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+    """
+    Merge a new sequencing batch into a previously organized workbook.
+
+    Parameters
+    ----------
+    prev_sheets : dict
+        Sheets of the previous workbook (read_previous_workbook): 'OTUs' plus the *_read / *(%) sheets.
+    new_otus : DataFrame
+        build_otus() of the new batch (same function as the new mode).
+
+    Both OTUs tables are keyed on the lineage (previous workbooks written before lineages were
+    collapsed are collapsed here), so the merge is one-to-one and every sample keeps its reads.
+    Only the new sample columns are aggregated and converted to percentages; previous columns
+    are reused and aligned on the merged taxa (a new taxon is 0 in previous samples). The
+    rank(%) tables are re-filtered because a new sample can lift a taxon above 1%.
+
+    The formatted report (summary rows, rankings) is not updated here: its minor group and
+    rankings depend on the rows the re-filtered rank(%) sheets keep, which can change for
+    previous samples too, so step 8 (taxa_organized_organizer) is re-run on the new workbook.
+
+    Returns
+    -------
+    dict {sheet_name: DataFrame} in the workbook's sheet order.
+    """
+    prev_otus = collapse_lineages(prev_sheets['OTUs'])
+    prev_samples = sample_columns(prev_otus)
+    new_samples = sample_columns(new_otus)
+    dup = [c for c in new_samples if c in prev_samples]
+    if dup:
+        raise ValueError(f"Samples already present in the previous workbook: {dup}")
+
+    otus = prev_otus.reset_index().merge(new_otus.reset_index(), on=LINEAGE_COLUMNS, how='outer',
+                                         suffixes=('', '_new'), sort=False)
+    otus['Feature ID'] = otus['Feature ID'].fillna(otus.pop('Feature ID_new'))
+    otus[prev_samples + new_samples] = otus[prev_samples + new_samples].fillna(0).astype('int64')
+    otus = otus.set_index('Feature ID')[LINEAGE_COLUMNS + prev_samples + new_samples]
+    before = pd.concat([prev_otus[prev_samples].sum(), new_otus[new_samples].sum()])
+    assert otus[prev_samples + new_samples].sum().equals(before), "append_batch changed per-sample reads"
+
+    out = {'OTUs': otus}
+    new_sheets = build_organized_sheets(new_otus, new_samples)
+    for i, j, p, r in Number_name:
+        read = prev_sheets[j].join(new_sheets[j], how='outer').fillna(0).astype('int64')
+        per = prev_sheets[p].join(new_sheets[p], how='outer').fillna(0)
+        read.index.name = per.index.name = LINEAGE_COLUMNS[i]
+        out[j] = read
+        out[p] = per
+        out[r] = drop_minor(per)
+    return out
@@ -1,10 +1,12 @@
 import pandas as pd
-from functions.config import RANK_COLOR_RGB
+from functions.config import RANK_COLOR_RGB, MINOR_THRESHOLD, ORGANIZER_MINOR_CUT
+from functions.LineageIndex import LabelIndex
+from functions.Metadata import as_metadata
 import numpy as np
 
 def build_site_header_row(
     df: pd.DataFrame,
-    meta_df: pd.DataFrame,
+    meta_df,
     sampleid_col: str = "sampleid",
 ) -> pd.DataFrame:
     """
@@ -22,8 +24,9 @@ def build_site_header_row(
     df : DataFrame
         Input table where df.iloc[0, 1:] are sample IDs.
         Column 0 is the taxonomy/label column.
-    meta_df : DataFrame
-        Metadata with at least [sampleid_col, <desc1>, <desc2>, ...].
+    meta_df : SampleMetadata or DataFrame
+        Metadata with at least [sampleid_col, <desc1>, <desc2>, ...]
+        (pass the run's SampleMetadata to skip re-validating it per sheet).
     sampleid_col : str
         Name of the sample id column in metadata.
     Returns
@@ -32,38 +35,22 @@ def build_site_header_row(
     """
     df = df.copy()
 
-    # Basic checks and normalization
-    if sampleid_col not in meta_df.columns:
-        raise ValueError(f"Metadata is missing required column '{sampleid_col}'.")
-
-    # Ensure string types for safe mapping
-    meta_df = meta_df.copy().astype(str)
-    # If duplicate sampleids exist, keep the first occurrence
-    meta_df = meta_df.drop_duplicates(subset=[sampleid_col], keep="first")
+    # strings, duplicate sampleids -> first occurrence (done once if a SampleMetadata is passed)
+    meta = as_metadata(meta_df, sampleid_col)
 
     # Columns
-    tax_col = df.columns[0]
     sample_cols = list(df.columns[1:])
 
-    # The first row of df contains sample IDs for each sample column
-    sample_ids = meta_df.iloc[0, 1:].astype(str).tolist()
-
     # Description columns come from metadata, excluding the sampleid column
-    desc_cols = [c for c in meta_df.columns if c != sampleid_col]
+    desc_cols = meta.columns
 
-    # Build a mapping {desc_col: {sampleid -> value}}
-    desc_maps = {c: dict(zip(meta_df[sampleid_col], meta_df[c])) for c in desc_cols}
+    # Build description rows: one vectorized lookup per description column
+    block = np.empty((len(desc_cols), len(df.columns)), dtype=object)
+    for i, desc in enumerate(desc_cols):
+        block[i, 0] = desc
+        block[i, 1:] = meta.lookup(desc, sample_cols, default="")  # empty if missing in metadata
 
-    # Build description rows
-    desc_rows = []
-    for desc in desc_cols:
-        row_dict = {tax_col: desc}
-        m = desc_maps[desc]
-        for col in sample_cols:
-            row_dict[col] = m.get(col, "")  # empty if missing in metadata
-        desc_rows.append(row_dict)
-
-    desc_df = pd.DataFrame(desc_rows, columns=df.columns) if desc_rows else pd.DataFrame(columns=df.columns)
+    desc_df = pd.DataFrame(block, columns=df.columns) if desc_cols else pd.DataFrame(columns=df.columns)
 
     out = pd.concat([desc_df, df], ignore_index=True)
     return out
@@ -93,6 +80,31 @@ def append_total_reads_row(df: pd.DataFrame, read_df: pd.DataFrame) -> pd.DataFr
     return pd.concat([df, total_reads_df], ignore_index=True)
 
             
+def minor_group_label(threshold: float = MINOR_THRESHOLD) -> str:
+    """'minor group (<1%)' for the default threshold."""
+    return f"minor group (<{threshold:g}%)"
+
+def check_minor_threshold(threshold: float) -> float:
+    """
+    The rank(%) sheets only hold taxa at or above ORGANIZER_MINOR_CUT (taxa_organizer), so a lower
+    threshold cannot bring the dropped taxa back and would mislabel the minor group.
+    """
+    if threshold < ORGANIZER_MINOR_CUT:
+        raise ValueError(f"minor threshold must be at least {ORGANIZER_MINOR_CUT:g}% "
+                         f"(taxa_organizer already grouped the taxa below it), got {threshold:g}.")
+    return threshold
+
+def drop_minor_rows(df: pd.DataFrame, threshold: float) -> pd.DataFrame:
+    """
+    Drop taxon rows whose maximum over the sheet's samples is below threshold (%),
+    so their share goes to the minor group. 'unidentified' rows are kept.
+    """
+    tax_col = df.columns[0]
+    sample_cols = list(df.columns[1:])
+    unid = df[tax_col].astype(str).str.contains("unidentified", case=False, na=False)
+    below = df[sample_cols].apply(pd.to_numeric, errors="coerce").max(axis=1) < threshold
+    return df[~below | unid].reset_index(drop=True)
+
 def compute_minor_unidentified_identified_total(df):
     """
     Returns (minor_group, unidentified_vals, identified_vals, total_vals).
@@ -131,11 +143,12 @@ def append_summary_rows(df: pd.DataFrame,
                         minor_group: pd.Series,
                         unidentified_vals: pd.Series,
                         identified_vals: pd.Series,
-                        total_vals: pd.Series) -> pd.DataFrame:
+                        total_vals: pd.Series,
+                        minor_threshold: float = MINOR_THRESHOLD) -> pd.DataFrame:
     """Append the 4 summary rows to df (minor group, unidentified, Identified, Total reads)."""
     tax_col = df.columns[0]
     sample_cols = list(df.columns[1:])
-    extra_rows = pd.DataFrame({tax_col: ["minor group (<1%)", "unidentified", "Identified", "Total reads"]})
+    extra_rows = pd.DataFrame({tax_col: [minor_group_label(minor_threshold), "unidentified", "Identified", "Total reads"]})
     extra_rows = pd.concat(
         [
             extra_rows,
@@ -148,9 +161,12 @@ def append_summary_rows(df: pd.DataFrame,
     )
     return pd.concat([df, extra_rows], ignore_index=True)
 
-def compute_ranking_blocks(df_out, k: int = 5):
+def compute_ranking_blocks(df_out, k: int = 5, labels: LabelIndex = None,
+                           minor_threshold: float = MINOR_THRESHOLD):
     """
-    Build the ranking blocks from rows above 'minor group (<1%)'.
+    Build the ranking blocks from rows above 'minor group (<1%)' (see minor_group_label).
+    `labels` is the LabelIndex of df_out's label column (built here if not given).
+    k >= 5: the Σ(1~5) row and the rank colors need the top 5.
     Returns:
       row_colors          (# of colors)
       rows_values         (rank values rows '1'..'k')
@@ -160,15 +176,23 @@ def compute_ranking_blocks(df_out, k: int = 5):
     tax_col = df_out.columns[0]
     sample_cols = list(df_out.columns[1:])
 
+    if k < 5:
+        raise ValueError(f"k must be at least 5 (got {k}).")
+    if labels is None:
+        labels = LabelIndex(df_out[tax_col])
+
     # cutoff (row index for "minor group (<1%)")
-    minor_idx_list = df_out.index[df_out[tax_col].astype(str).str.strip().eq("minor group (<1%)")].tolist()
-    if not minor_idx_list:
-        raise ValueError("Row 'minor group (<1%)' not found in df_out; cannot compute rankings.")
-    cutoff_idx = minor_idx_list[0]
+    minor_label = minor_group_label(minor_threshold)
+    minor_pos = labels.first(minor_label)
+    if minor_pos is None:
+        raise ValueError(f"Row '{minor_label}' not found in df_out; cannot compute rankings.")
+    cutoff_idx = df_out.index[minor_pos]
 
     # rows above cutoff
     upper_df = df_out.iloc[:cutoff_idx].copy()
-    upper_df = upper_df[~upper_df[tax_col].astype(str).str.strip().eq("Total reads")]
+    keep = np.ones(len(upper_df), dtype=bool)
+    keep[[p for p in labels.rows("Total reads") if p < len(upper_df)]] = False
+    upper_df = upper_df[keep]
 
     upper_num = upper_df.set_index(tax_col)[sample_cols].apply(pd.to_numeric, errors="coerce").fillna(0.0)
 
@@ -212,86 +236,102 @@ def append_ranking_rows(df_out: pd.DataFrame,
     row_ranktag = pd.DataFrame([{df_out.columns[0]: "Ranking", **blank_vals}])
     return pd.concat([df_out, row_colors, row_ranktag, rows_values, row_sum_1_3, row_sum_1_5, rows_taxa], ignore_index=True)
 
-def write_sheet_with_formatting(writer, sheet, df_out,
-                                top_label, top_taxa_by_rank):
-    """
-    Write df_out to Excel with:
-      - blank leading column,
-      - taxonomy label in row 0 col 1 (bold black),
-      - coloring of rank rows (1..5) and corresponding top taxa values,
-      - correct offsets when using startrow=1.
-    """
-    # insert blank col at position 0 (entirely empty)
+def round_sheet_values(df_out: pd.DataFrame) -> pd.DataFrame:
+    """Round numeric sample columns (all but the label column) to 2 decimals."""
     df_out = df_out.copy()
-    df_out.insert(0, "", pd.NA)
-
-    # round numeric cells (data) to 2 decimals
-    for c in df_out.columns[2:]:
+    for c in df_out.columns[1:]:
         df_out[c] = pd.to_numeric(df_out[c], errors="ignore")
         if pd.api.types.is_numeric_dtype(df_out[c]):
             df_out[c] = df_out[c].round(2)
+    return df_out
 
-    # write table beginning at row 1 (so row 0 can hold the top taxonomy label)
-    df_out.to_excel(writer, sheet_name=sheet, index=False, startrow=1)
-
-    workbook = writer.book
-    worksheet = writer.sheets[sheet]
-
-    # put taxonomy label at top-left of taxonomy column (row 0, col 1)
-    bold_black = workbook.add_format({"font_color": "black", "bold": True})
-    worksheet.write(0, 1, top_label, bold_black)
-
-    # rank formats
-    fmt_rank = {rk: workbook.add_format({"font_color": col, "bold": True})
-                for rk, col in RANK_COLOR_RGB.items()}
-
-    # column mapping & offsets
-    label_col_idx = 1
-    label_col_name = df_out.columns[label_col_idx]
-    sample_cols_out = list(df_out.columns[2:])
-    ROW_OFFSET = 2  # startrow (1) + header (1)
+def rank_color_cells(df_out: pd.DataFrame, top_taxa_by_rank, labels: LabelIndex = None) -> list:
+    """
+    Cells to color by rank, as (row, col, rank) positions in df_out
+    (col 0 = taxonomy/label column, 1.. = samples), in drawing order:
+      - the '1'..'5' labels of both ranking blocks (numeric + taxon names),
+      - numeric cells of the first (numeric) ranking block,
+      - for each sample, the value of its top-k taxa in the upper part.
+    Renderers map rank -> color with RANK_COLOR_RGB.
+    `labels` is the LabelIndex of df_out's label column (built here if not given).
+    """
+    sample_cols = list(df_out.columns[1:])
+    if labels is None:
+        labels = LabelIndex(df_out[df_out.columns[0]])
+    cells = []
 
     # locate all '1'..'5' labels in the label column
-    rank_row_indices = {
-        rk: df_out.index[df_out[label_col_name].astype(str).str.strip().eq(rk)].tolist()
-        for rk in ["1", "2", "3", "4", "5"]
-    }
+    rank_row_indices = {rk: labels.rows(rk) for rk in RANK_COLOR_RGB}
 
     # color first-column labels for both blocks (numeric + taxon names)
     for rk, idx_list in rank_row_indices.items():
-        fmt = fmt_rank[rk]
         for r in idx_list:
-            worksheet.write(ROW_OFFSET + r, label_col_idx, df_out.iat[r, label_col_idx], fmt)
+            cells.append((r, 0, rk))
 
-    # first occurrence of each rank ('numeric' ranking block)
-    first_rank_row_idx = {rk: (idx_list[0] if idx_list else None) for rk, idx_list in rank_row_indices.items()}
+    def is_number(val):
+        return isinstance(val, (int, float, np.integer, np.floating)) and not pd.isna(val)
 
-    # color numeric ranking row cells
-    for rk, r in first_rank_row_idx.items():
-        if r is None:
+    # color numeric ranking row cells (first occurrence of each rank)
+    for rk, idx_list in rank_row_indices.items():
+        if not idx_list:
             continue
-        fmt = fmt_rank[rk]
-        for col_name in sample_cols_out:
-            j = df_out.columns.get_loc(col_name)
-            val = df_out.iat[r, j]
-            if isinstance(val, (int, float, np.integer, np.floating)):
-                worksheet.write(ROW_OFFSET + r, j, val, fmt)
+        r = idx_list[0]
+        for j in range(1, len(sample_cols) + 1):
+            if is_number(df_out.iat[r, j]):
+                cells.append((r, j, rk))
 
     # color corresponding top taxa values in the upper part
-    for rk, fmt in fmt_rank.items():
+    for rk in RANK_COLOR_RGB:
         taxa_series = top_taxa_by_rank.get(rk)
         if taxa_series is None:
             continue
-        for col_name in sample_cols_out:
+        for j, col_name in enumerate(sample_cols, start=1):
             taxon = taxa_series.get(col_name)
             taxon = "" if pd.isna(taxon) else str(taxon)
             if not taxon:
                 continue
-            matches = df_out.index[df_out[label_col_name].astype(str).str.strip().eq(taxon)].tolist()
-            if not matches:
+            r = labels.first(taxon)
+            if r is None:
                 continue
-            r = matches[0]
-            j = df_out.columns.get_loc(col_name)
-            val = df_out.iat[r, j]
-            if isinstance(val, (int, float, np.integer, np.floating)):
-                worksheet.write(ROW_OFFSET + r, j, val, fmt)
+            if is_number(df_out.iat[r, j]):
+                cells.append((r, j, rk))
+    return cells
+
+def write_sheet_with_formatting(writer, sheet, df_out,
+                                top_label, top_taxa_by_rank, labels: LabelIndex = None):
+    """
+    Write df_out to Excel with:
+      - blank leading column,
+      - taxonomy label in row 0 col 1 (bold black),
+      - coloring of rank rows (1..5) and corresponding top taxa values
+        (cells from rank_color_cells),
+      - correct offsets when using startrow=1.
+
+    `labels` is the LabelIndex of df_out's label column (see rank_color_cells).
+    """
+    # round numeric cells (data) to 2 decimals
+    df_out = round_sheet_values(df_out)
+    cells = rank_color_cells(df_out, top_taxa_by_rank, labels)
+
+    # insert blank col at position 0 (entirely empty)
+    df_xl = df_out.copy()
+    df_xl.insert(0, "", pd.NA)
+
+    # write table beginning at row 1 (so row 0 can hold the top taxonomy label)
+    df_xl.to_excel(writer, sheet_name=sheet, index=False, startrow=1)
+
+    workbook = writer.book
+    worksheet = writer.sheets[sheet]
+
+    # put taxonomy label at top-left of taxonomy column (row 0, col 1)
+    bold_black = workbook.add_format({"font_color": "black", "bold": True})
+    worksheet.write(0, 1, top_label, bold_black)
+
+    # rank formats
+    fmt_rank = {rk: workbook.add_format({"font_color": col, "bold": True})
+                for rk, col in RANK_COLOR_RGB.items()}
+
+    ROW_OFFSET = 2  # startrow (1) + header (1)
+    COL_OFFSET = 1  # blank leading column
+    for r, j, rk in cells:
+        worksheet.write(ROW_OFFSET + r, COL_OFFSET + j, df_out.iat[r, j], fmt_rank[rk])
@@ -1,42 +1,206 @@
+import queue
+import threading
+from functools import partial
 import pandas as pd
 import numpy as np
-from functions.config import EXCEL_IN, METADATA, TAXON_TOP_LABEL
+from functions.config import TAXON_TOP_LABEL, MINOR_THRESHOLD, ORGANIZER_MINOR_CUT
 from functions.ProcessHelper import build_site_header_row,find_read_sheet_name,\
-    append_total_reads_row,\
+    append_total_reads_row,check_minor_threshold,drop_minor_rows,\
         compute_minor_unidentified_identified_total,append_summary_rows,\
-    compute_ranking_blocks,append_ranking_rows,write_sheet_with_formatting
+    compute_ranking_blocks,append_ranking_rows
 from functions.PromptValues import apply_global_sample_order_to_df
+from functions.Metadata import SampleMetadata
+from functions.LineageIndex import LabelIndex
+from functions.StageProfiler import stage
+
+def list_target_sheets(xf):
+    """Sheets to process: those containing '(%)'."""
+    return [s for s in xf.sheet_names if "rank(%)" in s]
 
 def read_sheets(xf: pd.ExcelFile, sheet: str) -> pd.DataFrame:
     return xf.parse(sheet)
 
-def process_sheet(xf: pd.ExcelFile, sheet: str, writer: pd.ExcelWriter, global_sample_order) -> None:
-    """Full pipeline for one sheet."""
-    df = read_sheets(xf, sheet)
-    tax_col = df.columns[0]
-    sample_cols = list(df.columns[1:])
-    meta_df = pd.read_csv(METADATA, sep="\t", dtype=str)
+def read_sheet_pair(xf: pd.ExcelFile, sheet: str):
+    """Parse a rank(%) sheet and its *_read sheet. Returns (df, read_df)."""
+    with stage("parse sheet") as st:
+        df = read_sheets(xf, sheet)
+        st.shape(df)
+    read_sheet = find_read_sheet_name(sheet)
+    with stage("parse read sheet") as st:
+        read_df = read_sheets(xf, read_sheet)
+        st.shape(read_df)
+    return df, read_df
+
+def load_metadata() -> SampleMetadata:
+    from functions.config import METADATA
+    with stage("read metadata") as st:
+        meta = SampleMetadata.read(METADATA)
+        st.shape(meta.frame)
+    return meta
+
+def compute_sheet(sheet: str, df: pd.DataFrame, read_df: pd.DataFrame, meta_df: pd.DataFrame, global_sample_order,
+                  k: int = 5, minor_threshold: float = MINOR_THRESHOLD):
+    """
+    Build the ranked sheet model. Returns (df_out, top_label, top_taxa_by_rank, labels).
+    k = taxa per ranking block; a minor_threshold (%) above ORGANIZER_MINOR_CUT first moves the taxa
+    below it in every sample into the minor group (lower is an error, see check_minor_threshold).
+    labels = LabelIndex of df_out's label column, built once per sheet and shared by the ranking and
+    the renderers' rank colors.
+    """
+    if check_minor_threshold(minor_threshold) > ORGANIZER_MINOR_CUT:
+        with stage("minor threshold") as st:
+            df = drop_minor_rows(df, minor_threshold)
+            st.shape(df)
 
     # Insert description row (1st row as the column names)
-    df = build_site_header_row(df, meta_df, sampleid_col="sampleid")
+    with stage("site header rows") as st:
+        df = build_site_header_row(df, meta_df, sampleid_col="sampleid")
+        st.shape(df)
 
     # Append Total reads row from *_read sheet
-    read_sheet = find_read_sheet_name(sheet)
-    read_df = pd.read_excel(EXCEL_IN, sheet_name=read_sheet, engine="openpyxl")
-    df = append_total_reads_row(df, read_df)
-    
+    with stage("total reads row") as st:
+        df = append_total_reads_row(df, read_df)
+        st.shape(df)
+
     # sort samples based on prompted priority
-    df = apply_global_sample_order_to_df(df, global_sample_order)
-    
+    with stage("sample ordering") as st:
+        df = apply_global_sample_order_to_df(df, global_sample_order)
+        st.shape(df)
+
     # Compute summary rows then append them
-    minor_group, unidentified_vals, identified_vals, total_vals = compute_minor_unidentified_identified_total(df)
-    df_out = append_summary_rows(df, minor_group, unidentified_vals, identified_vals, total_vals)
+    with stage("summary rows") as st:
+        minor_group, unidentified_vals, identified_vals, total_vals = compute_minor_unidentified_identified_total(df)
+        df_out = append_summary_rows(df, minor_group, unidentified_vals, identified_vals, total_vals,
+                                     minor_threshold)
+        st.shape(df_out)
 
     # Ranking blocks
-    row_colors, rows_values, row_sum_1_3, row_sum_1_5, rows_taxa, top_taxa_by_rank = compute_ranking_blocks(df_out)
-    df_out = append_ranking_rows(df_out, row_colors, rows_values, row_sum_1_3, row_sum_1_5, rows_taxa)
+    with stage("ranking") as st:
+        labels = LabelIndex(df_out[df_out.columns[0]])
+        row_colors, rows_values, row_sum_1_3, row_sum_1_5, rows_taxa, top_taxa_by_rank = \
+            compute_ranking_blocks(df_out, k, labels=labels, minor_threshold=minor_threshold)
+        n_upper = len(df_out)
+        df_out = append_ranking_rows(df_out, row_colors, rows_values, row_sum_1_3, row_sum_1_5, rows_taxa)
+        labels.extend(df_out.iloc[n_upper:, 0])
+        st.shape(df_out)
 
-    # Write with formatting & coloring
     prefix = sheet.split("_", 1)[0]
     top_label = TAXON_TOP_LABEL.get(prefix, "")
-    write_sheet_with_formatting(writer, sheet, df_out, top_label, top_taxa_by_rank)
\ No newline at end of file
+    return df_out, top_label, top_taxa_by_rank, labels
+
+def render_sheet(renderer, sheet, df_out, top_label, top_taxa_by_rank, labels=None) -> None:
+    # Write with formatting & coloring
+    with stage("render") as st:
+        renderer.write(sheet, df_out, top_label, top_taxa_by_rank, labels=labels)
+        st.shape(df_out)
+
+def process_sheet(xf: pd.ExcelFile, sheet: str, renderer, global_sample_order, meta_df: pd.DataFrame = None,
+                  read_pair=None, k: int = 5, minor_threshold: float = MINOR_THRESHOLD) -> None:
+    """
+    Full pipeline for one sheet (each step is a profiled stage, see StageProfiler).
+    read_pair(sheet) -> (df, read_df) loads the sheet; read_sheet_pair on xf by default, or a bound
+    method of another source (DomainWorkbooks.read_pair, ParsedWorkbook.read_pair).
+    """
+    read_pair = read_pair or partial(read_sheet_pair, xf)
+    df, read_df = read_pair(sheet)
+    if meta_df is None:
+        meta_df = load_metadata()
+    render_sheet(renderer, sheet, *compute_sheet(sheet, df, read_df, meta_df, global_sample_order,
+                                                 k, minor_threshold))
+
+_DONE = object()
+
+def _put(q: queue.Queue, item, stop: threading.Event) -> bool:
+    """Blocking put that gives up once `stop` is set."""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def process_sheets_pipelined(xf: pd.ExcelFile, sheets, renderer, global_sample_order,
+                             meta_df: pd.DataFrame, depth: int = 0, read_pair=None, k: int = 5,
+                             minor_threshold: float = MINOR_THRESHOLD) -> None:
+    """
+    Same output as process_sheet() over `sheets`, with parsing, computing and rendering overlapped:
+
+        reader thread  --parsed(depth)-->  caller thread  --computed(depth)-->  writer thread
+        (openpyxl parse of                 (summary rows,                       (renderer.write,
+         rank(%) + *_read)                  rankings)                            one sheet at a time)
+
+    Bounded queues cap memory at ~2*depth sheets in flight. depth <= 0 runs the sheets one after
+    another in the caller: the threads share the GIL, so overlapping is usually slower (see
+    config.PREFETCH_DEPTH).
+    Single producer / single consumer FIFO queues keep the output sheet order identical to `sheets`.
+    The first exception in any stage stops the pipeline and is re-raised here.
+    read_pair(sheet) loads a sheet, as in process_sheet().
+    """
+    read_pair = read_pair or partial(read_sheet_pair, xf)
+    if depth <= 0:
+        for sheet in sheets:
+            process_sheet(xf, sheet, renderer, global_sample_order, meta_df=meta_df, read_pair=read_pair,
+                          k=k, minor_threshold=minor_threshold)
+        return
+
+    parsed_q: queue.Queue = queue.Queue(maxsize=depth)
+    render_q: queue.Queue = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    errors = []
+
+    def reader():
+        try:
+            for sheet in sheets:
+                if stop.is_set():
+                    return
+                df, read_df = read_pair(sheet)
+                if not _put(parsed_q, (sheet, df, read_df), stop):
+                    return
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            _put(parsed_q, _DONE, stop)
+
+    def writer():
+        # keeps draining after an error so the producer never blocks on a full queue
+        while True:
+            item = render_q.get()
+            if item is _DONE:
+                return
+            if stop.is_set():
+                continue
+            try:
+                render_sheet(renderer, *item)
+            except BaseException as e:
+                errors.append(e)
+                stop.set()
+
+    threads = [threading.Thread(target=reader, name="sheet-reader", daemon=True),
+               threading.Thread(target=writer, name="sheet-writer", daemon=True)]
+    for t in threads:
+        t.start()
+    try:
+        while not stop.is_set():
+            try:
+                item = parsed_q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if item is _DONE:
+                break
+            sheet, df, read_df = item
+            model = compute_sheet(sheet, df, read_df, meta_df, global_sample_order, k, minor_threshold)
+            _put(render_q, (sheet, *model), stop)
+            del df, read_df, item, model
+            if stop.is_set():
+                break
+    except BaseException as e:
+        errors.append(e)
+        stop.set()
+    finally:
+        render_q.put(_DONE)
+        for t in threads:
+            t.join()
+    if errors:
+        raise errors[0]
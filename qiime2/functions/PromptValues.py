@@ -1,13 +1,16 @@
 import pandas as pd
-import tkinter as tk
 from typing import Dict, List
 from functions.config import SITE_ORDER_BASE
+from functions.Metadata import as_metadata
+import numpy as np
 
 def prompt_sort_priority(desc_labels):
     """
     GUI dialog to choose sort priority from desc_labels.
     Returns a list of labels in priority order.
     """
+    import tkinter as tk
+
     root = tk.Tk()
     root.title("Choose sorting priority")
     root.geometry("520x320")
@@ -167,7 +170,7 @@ def get_site_order(meta_df, site_col="site"):
     - Append any unseen sites from metadata at the end (in the order they appear)
     """
     seen = set(SITE_ORDER_BASE)
-    all_sites = meta_df[site_col].astype(str).unique().tolist()
+    all_sites = as_metadata(meta_df).unique(site_col)
     extras = [s for s in all_sites if s not in seen]
     return SITE_ORDER_BASE + extras
 
@@ -177,10 +180,9 @@ def get_user_sort_spec_from_metadata(meta_df, sampleid_col='sampleid'):
     Step 2: for each chosen label, ask the user to order its unique values.
     Returns: { label -> [ordered values] }
     """
-    if sampleid_col not in meta_df.columns:
-        raise ValueError(f"Metadata is missing '{sampleid_col}'.")
+    meta = as_metadata(meta_df, sampleid_col)
     # Candidate labels = all metadata fields except sampleid
-    candidate_labels = [c for c in meta_df.columns if c != sampleid_col]
+    candidate_labels = list(meta.columns)
 
     # --- Step 1: ask which labels to prioritize ---
     priority_labels = prompt_sort_priority(candidate_labels)
@@ -191,11 +193,11 @@ def get_user_sort_spec_from_metadata(meta_df, sampleid_col='sampleid'):
     # --- Step 2: for each label, ask value order ---
     for label in priority_labels:
         if label.lower() == 'site':
-            site_order = get_site_order(meta_df, site_col="site")
+            site_order = get_site_order(meta, site_col="site")
             sort_spec[label] = site_order
             print(f"using preconfigured site order: {site_order}")
         else:
-            vals = meta_df[label].astype(str).unique().tolist()
+            vals = meta.unique(label)
             ordered = prompt_value_order_for_label(label, vals)  # list[str] or None
             if ordered is not None:
                 sort_spec[label] = ordered
@@ -203,32 +205,24 @@ def get_user_sort_spec_from_metadata(meta_df, sampleid_col='sampleid'):
     return sort_spec
 
 def compute_global_sample_order(
-    meta_df: pd.DataFrame,
+    meta_df,
     sort_spec: Dict[str, List[str]],
     sampleid_col: str = "sampleid",
 ) -> List[str]:
     """
     Produce a global ordered list of sample IDs based on sort_spec.
     Any sample whose value isn't listed gets ranked after listed ones for that label.
+    meta_df is the run's SampleMetadata (or a metadata DataFrame).
     """
-    meta = meta_df.astype(str).drop_duplicates(subset=[sampleid_col], keep="first")
-    sids = meta[sampleid_col].tolist()
-
-    # Precompute rank maps: label -> {value -> rank}, then {sid -> rank}
-    label_value_rank: Dict[str, Dict[str, int]] = {
-        lab: {v: i for i, v in enumerate(vals)} for lab, vals in sort_spec.items()
-    }
-    sid_rank_per_label: Dict[str, Dict[str, int]] = {}
-    for lab, v2r in label_value_rank.items():
-        lab_map = dict(zip(meta[sampleid_col], meta[lab].astype(str)))
-        sid_rank_per_label[lab] = {sid: v2r.get(lab_map.get(sid, ""), 10**9) for sid in sids}
-
-    labels_in_order = list(sort_spec.keys())
-
-    def key_for_sid(sid: str):
-        return tuple(sid_rank_per_label[lab][sid] for lab in labels_in_order)
-
-    return sorted(sids, key=key_for_sid)
+    meta = as_metadata(meta_df, sampleid_col)
+    sids = meta.sample_ids
+
+    # rank of every sample per label (vectorized over the categories), first label = primary key
+    keys = [meta.rank_codes(lab, vals) for lab, vals in sort_spec.items()]
+    if not keys:
+        return list(sids)
+    order = np.lexsort(keys[::-1])  # stable, like sorted() on the rank tuples
+    return [sids[i] for i in order]
 
 def apply_global_sample_order_to_df(
     df: pd.DataFrame,
@@ -0,0 +1,250 @@
+import html
+import os
+import re
+from typing import List, Tuple
+
+import pandas as pd
+from functions.config import RANK_COLOR_RGB
+from functions.ProcessHelper import round_sheet_values, rank_color_cells, write_sheet_with_formatting
+
+# Renderers share one interface: write(sheet, df_out, top_label, top_taxa_by_rank, labels=None) per sheet,
+# then close(). df_out is the ranked sheet model from process_sheet; rank colors come from rank_color_cells(),
+# with `labels` the sheet's LabelIndex from compute_sheet (built again when not given).
+
+
+def safe_sheet_name(sheet: str) -> str:
+    """'G_rank(%)' -> 'G_rank_pct' (usable as a file name)."""
+    return re.sub(r"[^0-9A-Za-z_.-]+", "_", sheet.replace("(%)", "_pct")).strip("_")
+
+
+def color_annotations(df_out: pd.DataFrame, top_taxa_by_rank, labels=None) -> pd.DataFrame:
+    """rank_color_cells() as a table: row, column, label, rank, color, value."""
+    label_col = df_out.columns[0]
+    rows = []
+    for r, j, rk in rank_color_cells(df_out, top_taxa_by_rank, labels):
+        rows.append({
+            "row": r,
+            "column": str(df_out.columns[j]) if j else label_col,
+            "label": df_out.iat[r, 0],
+            "rank": int(rk),
+            "color": RANK_COLOR_RGB[rk],
+            "value": df_out.iat[r, j],
+        })
+    return pd.DataFrame(rows, columns=["row", "column", "label", "rank", "color", "value"])
+
+
+def sheet_sections(df_out: pd.DataFrame):
+    """
+    Row slices of a ranked sheet model:
+      header   metadata description rows (site, round, ...: text in every sample column)
+      taxa     taxon rows (% of reads)
+      summary  'minor group (<x%)' .. '# of colors'
+      values   rank values 1..k, Σ(1~3) and Σ(1~5)
+      names    top taxon names 1..k
+    A plain table without summary / ranking rows (e.g. the ARC : BAC ratio sheet) has all its rows
+    after the header in 'taxa' and empty summary / values / names.
+    """
+    labels = df_out.iloc[:, 0].astype(str).tolist()
+    values = df_out.iloc[:, 1:].to_numpy(dtype=object)
+    n_header = 0
+    while values.shape[1] and n_header < len(labels) and all(isinstance(v, str) for v in values[n_header]):
+        n_header += 1
+    end = len(labels)
+    if "Ranking" not in labels:
+        return {"header": slice(0, n_header), "taxa": slice(n_header, end), "summary": slice(end, end),
+                "values": slice(end, end), "names": slice(end, end)}
+    ranking = labels.index("Ranking")
+    minor = next((i for i, lab in enumerate(labels) if lab.startswith("minor group (<")), ranking)
+    sums_end = labels.index("Σ(1~5) (%)") + 1
+    return {"header": slice(0, n_header), "taxa": slice(n_header, minor), "summary": slice(minor, ranking),
+            "values": slice(ranking + 1, sums_end), "names": slice(sums_end, len(labels))}
+
+
+class ExcelRenderer:
+    """Formatted .xlsx (xlsxwriter), as before."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.writer = pd.ExcelWriter(path, engine="xlsxwriter")
+
+    def write(self, sheet, df_out, top_label, top_taxa_by_rank, labels=None):
+        write_sheet_with_formatting(self.writer, sheet, df_out, top_label, top_taxa_by_rank, labels=labels)
+
+    def close(self):
+        self.writer.close()
+
+
+class TsvRenderer:
+    """
+    One folder with, per sheet, '<sheet>.tsv' (ranked table, first line = '# <taxonomy label>')
+    and '<sheet>.colors.tsv' (rank-color annotations).
+    """
+    ext = ".tsv"
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def _write_table(self, df: pd.DataFrame, path: str, top_label: str):
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            f.write(f"# {top_label}\n")
+            df.to_csv(f, sep="\t", index=False)
+
+    def write(self, sheet, df_out, top_label, top_taxa_by_rank, labels=None):
+        df_out = round_sheet_values(df_out)
+        base = os.path.join(self.path, safe_sheet_name(sheet))
+        self._write_table(df_out, base + self.ext, top_label)
+        color_annotations(df_out, top_taxa_by_rank, labels).to_csv(base + ".colors" + self.ext, sep="\t", index=False)
+
+    def close(self):
+        pass
+
+
+class ParquetRenderer:
+    """
+    One folder of typed tables per sheet (needs pyarrow or fastparquet), for scripts:
+      '<sheet>.parquet'          taxa x samples, float64 (%); taxonomy label in the file metadata
+      '<sheet>.summary.parquet'  minor group, unidentified, Identified, Total reads, # of colors,
+                                 rank values 1..k and the Σ rows, float64
+      '<sheet>.ranking.parquet'  rank 1..k x samples, names of the top taxa
+      '<sheet>.samples.parquet'  one row per sample: its metadata description values (site, round, ...)
+      '<sheet>.colors.parquet'   rank-color annotations (as the TSV output)
+    Values are not rounded (the Excel / TSV / HTML outputs show 2 decimals).
+    A sheet without ranking rows (the ARC : BAC ratio sheet) gets the table and samples files only.
+    """
+    ext = ".parquet"
+
+    def __init__(self, path: str):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            try:
+                import fastparquet  # noqa: F401
+            except ImportError:
+                raise ImportError("Parquet output needs 'pyarrow' (conda install pyarrow) or 'fastparquet'.")
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    @staticmethod
+    def _numeric(df: pd.DataFrame) -> pd.DataFrame:
+        out = df.iloc[:, 1:].apply(pd.to_numeric, errors="coerce").astype("float64")
+        out.insert(0, df.columns[0], df.iloc[:, 0].astype(str).to_numpy())
+        return out.reset_index(drop=True)
+
+    @staticmethod
+    def _text(df: pd.DataFrame) -> pd.DataFrame:
+        # astype / where instead of DataFrame.map (pandas >= 2.1; QIIME 2 2023.2 has pandas 1.5)
+        return df.astype(str).where(df.notna(), None).reset_index(drop=True)
+
+    def _save(self, df: pd.DataFrame, base: str, part: str, top_label: str):
+        df = df.copy()
+        df.columns = [str(c) for c in df.columns]
+        df.attrs["top_label"] = top_label
+        df.to_parquet(f"{base}{part}{self.ext}", index=False)
+
+    def write(self, sheet, df_out, top_label, top_taxa_by_rank, labels=None):
+        base = os.path.join(self.path, safe_sheet_name(sheet))
+        parts = sheet_sections(df_out)
+        self._save(self._numeric(df_out.iloc[parts["taxa"]]), base, "", top_label)
+        header = df_out.iloc[parts["header"]].set_index(df_out.columns[0]).T
+        samples = self._text(header.rename_axis(None, axis=1))
+        samples.insert(0, "sample", [str(c) for c in df_out.columns[1:]])
+        self._save(samples, base, ".samples", top_label)
+        if parts["names"].start == len(df_out):
+            return
+        summary = pd.concat([df_out.iloc[parts["summary"]], df_out.iloc[parts["values"]]])
+        self._save(self._numeric(summary), base, ".summary", top_label)
+        ranking = self._text(df_out.iloc[parts["names"]]).rename(columns={df_out.columns[0]: "rank"})
+        self._save(ranking, base, ".ranking", top_label)
+        colors = color_annotations(df_out, top_taxa_by_rank, labels)
+        colors["value"] = pd.to_numeric(colors["value"], errors="coerce").astype("float64")
+        colors["label"] = colors["label"].astype(str)
+        self._save(colors, base, ".colors", top_label)
+
+    def close(self):
+        pass
+
+
+class HtmlRenderer:
+    """Single self-contained HTML file, one table per sheet, rank colors as in Excel."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.sections: List[Tuple[str, str]] = []
+
+    @staticmethod
+    def _cell(val) -> str:
+        if val is None or (not isinstance(val, str) and pd.isna(val)):
+            return ""
+        return html.escape(str(val))
+
+    def write(self, sheet, df_out, top_label, top_taxa_by_rank, labels=None):
+        df_out = round_sheet_values(df_out)
+        styles = {(r, j): RANK_COLOR_RGB[rk] for r, j, rk in rank_color_cells(df_out, top_taxa_by_rank, labels)}
+
+        parts = [f'<h2 id="{html.escape(safe_sheet_name(sheet))}">{html.escape(sheet)}</h2>',
+                 f"<table><caption>{html.escape(top_label)}</caption><thead><tr>"]
+        parts += [f"<th>{self._cell(c)}</th>" for c in df_out.columns]
+        parts.append("</tr></thead><tbody>")
+        values = df_out.to_numpy(dtype=object)
+        for r in range(values.shape[0]):
+            parts.append("<tr>")
+            for j in range(values.shape[1]):
+                color = styles.get((r, j))
+                style = f' style="color:{color};font-weight:bold"' if color else ""
+                parts.append(f"<td{style}>{self._cell(values[r, j])}</td>")
+            parts.append("</tr>")
+        parts.append("</tbody></table>")
+        self.sections.append((sheet, "".join(parts)))
+
+    def close(self):
+        nav = " | ".join(f'<a href="#{html.escape(safe_sheet_name(s))}">{html.escape(s)}</a>' for s, _ in self.sections)
+        doc = (
+            "<!DOCTYPE html><html><head><meta charset=\"utf-8\"><title>NGS organized</title><style>"
+            "body{font-family:sans-serif;font-size:12px}table{border-collapse:collapse;margin-bottom:24px}"
+            "td,th{border:1px solid #ddd;padding:2px 6px;white-space:nowrap}"
+            "caption{text-align:left;font-weight:bold}"
+            "</style></head><body>"
+            f"<nav>{nav}</nav>" + "".join(body for _, body in self.sections) + "</body></html>"
+        )
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write(doc)
+
+
+class MultiRenderer:
+    """Fan out each sheet to several renderers."""
+
+    def __init__(self, renderers):
+        self.renderers = renderers
+
+    def write(self, sheet, df_out, top_label, top_taxa_by_rank, labels=None):
+        for r in self.renderers:
+            r.write(sheet, df_out, top_label, top_taxa_by_rank, labels=labels)
+
+    def close(self):
+        for r in self.renderers:
+            r.close()
+
+
+# format -> (renderer class, output path suffix added to the output name without extension)
+RENDERERS = {
+    "xlsx": (ExcelRenderer, ".xlsx"),
+    "tsv": (TsvRenderer, "_tsv"),
+    "parquet": (ParquetRenderer, "_parquet"),
+    "html": (HtmlRenderer, ".html"),
+}
+
+
+def open_renderer(formats: str, out_path: str):
+    """
+    Renderer for a comma-separated list of formats (e.g. 'tsv,html').
+    Outputs are named after out_path without its extension:
+    'ngs-organized/run.xlsx' -> run.xlsx / run_tsv/ / run_parquet/ / run.html
+    """
+    base = os.path.splitext(out_path)[0]
+    fmts = [f.strip().lower() for f in formats.split(",") if f.strip()] or ["xlsx"]
+    unknown = [f for f in fmts if f not in RENDERERS]
+    if unknown:
+        raise ValueError(f"Unknown output format(s) {unknown}. Choose from {list(RENDERERS)}.")
+    renderers = [RENDERERS[f][0](base + RENDERERS[f][1]) for f in fmts]
+    return renderers[0] if len(renderers) == 1 else MultiRenderer(renderers)
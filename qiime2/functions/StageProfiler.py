@@ -0,0 +1,164 @@
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional
+
+try:
+    import resource  # not available on Windows
+except ImportError:
+    resource = None
+
+# Set NGS_PROFILE=1 to enable; NGS_PROFILE_DIR overrides the log directory.
+# NGS_PROFILE_PYMEM=1 also traces Python allocations (tracemalloc, Python >= 3.9): per-stage peaks,
+# but tracing slows the pure-Python parse / write stages, so it is off by default.
+PROFILE_ENV = "NGS_PROFILE"
+PROFILE_DIR_ENV = "NGS_PROFILE_DIR"
+PYMEM_ENV = "NGS_PROFILE_PYMEM"
+DEFAULT_LOG_DIR = "profile-logs"
+
+_run: Optional[Dict] = None
+_lock = threading.Lock()
+
+
+def _env_flag(name: str) -> bool:
+    return os.environ.get(name, "").strip().lower() not in ("", "0", "false", "no")
+
+
+def profiling_enabled() -> bool:
+    return _env_flag(PROFILE_ENV)
+
+
+def _rss_mb() -> Optional[float]:
+    """Current resident set size (Linux /proc), None elsewhere."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, AttributeError, IndexError):
+        return None
+
+
+def _max_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+class StageRecord(dict):
+    """One stage measurement; call .shape(df) inside the stage to record rows/columns."""
+
+    def shape(self, df) -> None:
+        if df is not None and hasattr(df, "shape"):
+            self["rows"] = int(df.shape[0])
+            self["cols"] = int(df.shape[1]) if len(df.shape) > 1 else 1
+
+
+def start_run(name: str, enabled: Optional[bool] = None) -> None:
+    """
+    Start a profiled run. Stages are appended as JSON lines to
+    <log dir>/<name>-<timestamp>.jsonl. No-op unless enabled (or NGS_PROFILE is set).
+    """
+    global _run
+    if enabled is None:
+        enabled = profiling_enabled()
+    if not enabled:
+        _run = None
+        return
+
+    log_dir = os.environ.get(PROFILE_DIR_ENV, DEFAULT_LOG_DIR)
+    os.makedirs(log_dir, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    _run = {
+        "name": name,
+        "log_path": os.path.join(log_dir, f"{name}-{stamp}.jsonl"),
+        "records": [],
+        "t0": time.perf_counter(),
+        # reset_peak() is Python >= 3.9 (QIIME 2 2023.2 ships 3.8)
+        "pymem": _env_flag(PYMEM_ENV) and hasattr(tracemalloc, "reset_peak"),
+    }
+    if _run["pymem"] and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+@contextmanager
+def stage(name: str, df=None):
+    """
+    Measure wall time, CPU time of the calling thread, RSS (current, change over the stage, max)
+    and, with NGS_PROFILE_PYMEM=1, the Python peak memory (tracemalloc) of the enclosed block.
+    Yields a StageRecord (also when profiling is off, so call sites do not need to branch).
+    Stages are not meant to be nested. Stages may run on several threads (pipelined sheets):
+    cpu_s only counts the stage's own thread, but RSS and the tracemalloc peak are process-wide,
+    so overlapping stages share them.
+    """
+    rec = StageRecord(stage=name)
+    if _run is None:
+        yield rec
+        return
+
+    rec.shape(df)
+    if _run["pymem"]:
+        tracemalloc.reset_peak()
+    rss0 = _rss_mb()
+    wall0, cpu0 = time.perf_counter(), time.thread_time()
+    try:
+        yield rec
+    finally:
+        rec["wall_s"] = round(time.perf_counter() - wall0, 6)
+        rec["cpu_s"] = round(time.thread_time() - cpu0, 6)
+        rss = _rss_mb()
+        rec["rss_mb"] = round(rss, 3) if rss is not None else None
+        rec["rss_delta_mb"] = round(rss - rss0, 3) if rss is not None and rss0 is not None else None
+        rec["py_peak_mb"] = (round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 3)
+                             if _run["pymem"] else None)
+        rss = _max_rss_mb()
+        rec["max_rss_mb"] = round(rss, 3) if rss is not None else None
+        rec["run"] = _run["name"]
+        rec["thread"] = threading.current_thread().name
+        with _lock:
+            _run["records"].append(rec)
+            with open(_run["log_path"], "a", encoding="utf-8") as f:
+                f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+
+
+def summarize(records: List[Dict]) -> List[Dict]:
+    """Aggregate records per stage name (calls, total wall/cpu, largest RSS growth, max peaks), slowest first."""
+    out: Dict[str, Dict] = {}
+    for r in records:
+        s = out.setdefault(r["stage"], {"stage": r["stage"], "calls": 0, "wall_s": 0.0, "cpu_s": 0.0,
+                                        "rss_delta_mb": None, "py_peak_mb": None, "max_rss_mb": None})
+        s["calls"] += 1
+        s["wall_s"] += r.get("wall_s", 0.0)
+        s["cpu_s"] += r.get("cpu_s", 0.0)
+        for key in ("rss_delta_mb", "py_peak_mb"):
+            if r.get(key) is not None:
+                s[key] = r[key] if s[key] is None else max(s[key], r[key])
+        if r.get("max_rss_mb") is not None:
+            s["max_rss_mb"] = max(s["max_rss_mb"] or 0.0, r["max_rss_mb"])
+    return sorted(out.values(), key=lambda s: s["wall_s"], reverse=True)
+
+
+def finish_run() -> None:
+    """Print the per-stage summary table and stop profiling."""
+    global _run
+    if _run is None:
+        return
+    total = time.perf_counter() - _run["t0"]
+    rows = summarize(_run["records"])
+
+    print(f"\n[profile] {_run['name']}  total {total:.2f}s  log: {_run['log_path']}")
+    print(f"{'stage':<28}{'calls':>6}{'wall(s)':>10}{'cpu(s)':>10}{'+rss(MB)':>10}{'rss(MB)':>10}"
+          f"{'py peak(MB)':>12}")
+    fmt = lambda v, width: f"{v:>{width}.1f}" if v is not None else f"{'-':>{width}}"
+    for s in rows:
+        print(f"{s['stage']:<28}{s['calls']:>6}{s['wall_s']:>10.3f}{s['cpu_s']:>10.3f}"
+              f"{fmt(s['rss_delta_mb'], 10)}{fmt(s['max_rss_mb'], 10)}{fmt(s['py_peak_mb'], 12)}")
+
+    if _run["pymem"]:
+        tracemalloc.stop()
+    _run = None
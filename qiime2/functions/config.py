@@ -1,13 +1,62 @@
-from tkinter import filedialog
 import os
 
 
-EXCEL_IN = filedialog.askopenfilename(title = "Open taxa organized file")
-METADATA = filedialog.askopenfilename(title = "Open metadata file .tsv")
-if not os.path.exists('ngs-organized'):
-    os.makedirs('ngs-organized')
+# Input/output paths are asked lazily (on first import of the name), so modules that only
+# need the constants below never open a dialog or import tkinter (e.g. create_metadata.py on a
+# server without Tk). Set the env variables to skip the prompts.
+PATH_PROMPTS = {
+    "EXCEL_IN": ("NGS_EXCEL_IN", "Open taxa organized file"),
+    "METADATA": ("NGS_METADATA", "Open metadata file .tsv"),
+    # taxa_combined_organizer (both domains in one report)
+    "EXCEL_IN_ARC": ("NGS_EXCEL_IN_ARC", "Open ARC taxa organized file"),
+    "EXCEL_IN_BAC": ("NGS_EXCEL_IN_BAC", "Open BAC taxa organized file"),
+    "METADATA_ARC": ("NGS_METADATA_ARC", "Open ARC metadata file .tsv"),
+    "METADATA_BAC": ("NGS_METADATA_BAC", "Open BAC metadata file .tsv"),
+}
+
+def _ask_excel_out():
+    name = os.environ.get("NGS_EXCEL_OUT")
+    if name:
+        return name
+    if not os.path.exists('ngs-organized'):
+        os.makedirs('ngs-organized')
+    return 'ngs-organized/' + input("file name (add .xlsx): ")
+
+def __getattr__(name):
+    if name in PATH_PROMPTS:
+        env, title = PATH_PROMPTS[name]
+        value = os.environ.get(env)
+        if not value:
+            from tkinter import filedialog
+            value = filedialog.askopenfilename(title = title)
+    elif name == "EXCEL_OUT":
+        value = _ask_excel_out()
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value
+    return value
 
-EXCEL_OUT = 'ngs-organized/' + input("file name (add .xlsx): ")
+# Output renderers for taxa_organized_organizer: comma-separated xlsx / tsv / parquet / html
+OUTPUT_FORMAT = os.environ.get("NGS_OUTPUT_FORMAT", "xlsx")
+# Sheets parsed ahead / waiting to be written while one is computed (0 = strictly sequential).
+# Off by default: the reader / writer threads share the GIL with the computation and made the
+# medium benchmark slower (8.35 s vs 7.04 s sequential).
+PREFETCH_DEPTH = int(os.environ.get("NGS_PREFETCH_DEPTH", "0"))
+# % below which taxa_organizer already left taxa out of the rank(%) sheets
+ORGANIZER_MINOR_CUT = 1
+# Taxa whose maximum % over a sheet's samples is below this go to the minor group
+# (at least ORGANIZER_MINOR_CUT; a higher value folds more taxa into the minor group)
+MINOR_THRESHOLD = float(os.environ.get("NGS_MINOR_THRESHOLD", str(ORGANIZER_MINOR_CUT)))
+# organizer_worker.py: localhost port, and input files (workbooks / metadata) kept parsed
+WORKER_PORT = int(os.environ.get("NGS_WORKER_PORT", "8765"))
+WORKER_CACHE = int(os.environ.get("NGS_WORKER_CACHE", "4"))
+# token written by the worker at each start (owner-only file, {port} = its port) and sent back
+# by organizer_client in the WORKER_TOKEN_HEADER header
+WORKER_TOKEN_FILE = os.environ.get("NGS_WORKER_TOKEN_FILE", ".organizer-worker-{port}.token")
+WORKER_TOKEN_HEADER = "X-Worker-Token"
+# Metadata column pairing an ARC sample with its BAC sample in the combined report
+# ('' = the sample ID without its ARC / BAC token, e.g. CJU-0d-ARC and CJU-0d-BAC -> CJU-0d)
+PAIR_KEY = os.environ.get("NGS_PAIR_KEY", "")
 
 RANK_COLOR_RGB = {
     "1": "black",
@@ -0,0 +1,78 @@
+"""
+Client for organizer_worker.py (no pandas import, so it starts instantly).
+
+Usage (from the qiime2 folder, with the worker running):
+    python organizer_client.py job.json     # run a job, print output path / timing
+    python organizer_client.py --status     # cached workbooks / metadata
+    python organizer_client.py --clear      # drop the cached inputs
+    python organizer_client.py --stop       # stop the worker
+Port: --port or NGS_WORKER_PORT (8765). The job format is described in organizer_worker.py.
+The worker's token is read from WORKER_TOKEN_FILE, so run the client from the worker's folder.
+"""
+import argparse
+import json
+import sys
+import urllib.error
+import urllib.request
+
+from functions.config import WORKER_PORT, WORKER_TOKEN_FILE, WORKER_TOKEN_HEADER
+
+def read_token(port: int = WORKER_PORT) -> str:
+    """Token the worker on `port` wrote at start (FileNotFoundError if it is not running here)."""
+    with open(WORKER_TOKEN_FILE.format(port = port), encoding = "utf-8") as f:
+        return f.read().strip()
+
+def request(path: str, job: dict = None, port: int = WORKER_PORT) -> dict:
+    """Call the worker and return its JSON answer (job errors raise RuntimeError)."""
+    data = json.dumps(job).encode("utf-8") if job is not None else None
+    req = urllib.request.Request(f"http://127.0.0.1:{port}{path}", data = data,
+                                 headers = {"Content-Type": "application/json",
+                                            WORKER_TOKEN_HEADER: read_token(port)},
+                                 method = "GET" if job is None else "POST")
+    try:
+        with urllib.request.urlopen(req) as resp:
+            return json.loads(resp.read())
+    except urllib.error.HTTPError as e:
+        raise RuntimeError(json.loads(e.read()).get("error", str(e)))
+
+def run(job: dict, port: int = WORKER_PORT) -> dict:
+    """Run one job on the worker: {'output', 'format', 'sheets', 'cache', 'seconds', ...}."""
+    return request("/run", job, port)
+
+def main():
+    parser = argparse.ArgumentParser(description="Client for organizer_worker.py")
+    parser.add_argument("job", nargs="?", help="job JSON file")
+    parser.add_argument("--port", type=int, default=WORKER_PORT)
+    parser.add_argument("--status", action="store_true", help="list the worker's cached inputs")
+    parser.add_argument("--clear", action="store_true", help="drop the worker's cached inputs")
+    parser.add_argument("--stop", action="store_true", help="stop the worker")
+    args = parser.parse_args()
+
+    try:
+        if args.job:
+            with open(args.job, encoding="utf-8") as f:
+                result = run(json.load(f), args.port)
+        elif args.status:
+            result = request("/status", port = args.port)
+        elif args.clear:
+            result = request("/clear", {}, args.port)
+        elif args.stop:
+            result = request("/shutdown", {}, args.port)
+        else:
+            parser.error("give a job file or --status / --clear / --stop")
+    except RuntimeError as e:
+        print("job failed:", e)
+        sys.exit(1)
+    except FileNotFoundError as e:
+        if e.filename != WORKER_TOKEN_FILE.format(port = args.port):
+            raise
+        print(f"no worker token {e.filename} (start the worker from this folder: python organizer_worker.py)")
+        sys.exit(1)
+    except urllib.error.URLError as e:
+        print(f"no worker on port {args.port} (start it with: python organizer_worker.py):", e.reason)
+        sys.exit(1)
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
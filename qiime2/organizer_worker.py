@@ -0,0 +1,208 @@
+"""
+Warm worker for taxa_organized_organizer: one long-running process keeps pandas / openpyxl /
+xlsxwriter imported and the parsed workbooks and metadata in memory, so re-running the report
+with another sort order, k or threshold only pays for ordering, ranking and writing.
+
+Usage (from the qiime2 folder):
+    python organizer_worker.py                  # serve on 127.0.0.1:NGS_WORKER_PORT (8765)
+    python organizer_client.py job.json         # run a job on the worker (see organizer_client.py)
+
+Job (JSON, paths relative to the worker's folder):
+    {
+      "excel_in": "taxa-organized/BAC.xlsx",
+      "metadata": "../fastq/sample-metadata-bac.tsv",
+      "output": "ngs-organized/run.xlsx",
+      "format": "xlsx",                          # optional, as NGS_OUTPUT_FORMAT
+      "sort_spec": {"site": null, "round": ["R2", "R1"]},
+      "k": 5,                                    # optional, taxa per ranking block (>= 5)
+      "minor_threshold": 1                       # optional, as NGS_MINOR_THRESHOLD (>= 1)
+    }
+sort_spec keys are the sort priority (first = primary); null values = preconfigured site order
+for 'site', order of appearance in the metadata otherwise.
+Jobs run one at a time. The server only listens on localhost, and a request is refused unless it
+  - carries the token the worker wrote at start to WORKER_TOKEN_FILE (X-Worker-Token header),
+  - has Host 127.0.0.1:<port> or localhost:<port> (no DNS rebinding),
+  - is JSON (Content-Type: application/json) for POSTs,
+so a web page open in a browser cannot run jobs (CSRF with text/plain POSTs).
+"""
+import argparse
+import hmac
+import json
+import os
+import secrets
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import numpy as np  # noqa: F401  (imported once, kept warm)
+import pandas as pd  # noqa: F401
+import openpyxl  # noqa: F401  (workbook parsing)
+import xlsxwriter  # noqa: F401  (xlsx output)
+
+from functions.config import OUTPUT_FORMAT, PREFETCH_DEPTH, MINOR_THRESHOLD, \
+    WORKER_PORT, WORKER_CACHE, WORKER_TOKEN_FILE, WORKER_TOKEN_HEADER
+from functions.InputCache import InputCache
+from functions.ProcessHelper import check_minor_threshold
+from functions.ProcessSheet import process_sheets_pipelined, list_target_sheets
+from functions.PromptValues import get_site_order, compute_global_sample_order
+from functions.Renderers import open_renderer
+from functions.StageProfiler import start_run, stage, finish_run
+
+JOB_KEYS = {"excel_in", "metadata", "output", "format", "sort_spec", "k", "minor_threshold"}
+REQUIRED_KEYS = ("excel_in", "metadata", "output")
+
+def resolve_sort_spec(meta, sort_spec):
+    """Job sort_spec -> {label: [ordered values]}; null = site order / order of appearance."""
+    out = {}
+    for label, values in (sort_spec or {}).items():
+        if label not in meta.columns:
+            raise ValueError(f"sort label '{label}' is not a metadata column {meta.columns}.")
+        if values is None:
+            values = get_site_order(meta, site_col=label) if label.lower() == "site" else meta.unique(label)
+        out[label] = [str(v) for v in values]
+    return out
+
+def run_job(job: dict, cache: InputCache) -> dict:
+    """Render one job with the cached inputs. Returns the result sent back to the client."""
+    unknown = set(job).difference(JOB_KEYS)
+    missing = [k for k in REQUIRED_KEYS if not job.get(k)]
+    if unknown or missing:
+        raise ValueError(f"unknown job keys {sorted(unknown)}, missing {missing}.")
+    minor_threshold = check_minor_threshold(float(job.get("minor_threshold", MINOR_THRESHOLD)))
+    t0 = time.perf_counter()
+    start_run("organizer_worker")
+
+    wb, wb_hit = cache.get_workbook(job["excel_in"])
+    meta, meta_hit = cache.get_metadata(job["metadata"])
+    sheets = list_target_sheets(wb)
+    if not (wb_hit and meta_hit):
+        # checked once per workbook / metadata pair, like taxa_organized_organizer
+        meta.report(table_samples = wb.read_pair(sheets[0])[0].columns[1:] if sheets else None)
+
+    sort_spec = resolve_sort_spec(meta, job.get("sort_spec"))
+    with stage("global sample order"):
+        global_order = compute_global_sample_order(meta, sort_spec, sampleid_col="sampleid")
+
+    output, fmt = job["output"], job.get("format") or OUTPUT_FORMAT
+    if os.path.dirname(output):
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+    renderer = open_renderer(fmt, output)
+    process_sheets_pipelined(wb, sheets, renderer, global_order, meta, depth = PREFETCH_DEPTH,
+                             read_pair = wb.read_pair,
+                             k = int(job.get("k", 5)),
+                             minor_threshold = minor_threshold)
+    with stage("save output"):
+        renderer.close()
+    finish_run()
+
+    return {
+        "output": os.path.abspath(output),
+        "format": fmt,
+        "sheets": len(sheets),
+        "sort_spec": list(sort_spec),
+        "cache": {"workbook": "hit" if wb_hit else "miss", "metadata": "hit" if meta_hit else "miss"},
+        "seconds": round(time.perf_counter() - t0, 3),
+    }
+
+def write_token_file(path: str) -> str:
+    """New random token in `path`, readable by the current user only. Returns the token."""
+    if os.path.exists(path):
+        os.remove(path)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    token = secrets.token_hex(32)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(token)
+    return token
+
+class WorkerHandler(BaseHTTPRequestHandler):
+    """POST /run (job JSON), GET /status, POST /clear, POST /shutdown (see _refused)."""
+
+    cache: InputCache = None
+    token: str = None
+
+    def _reply(self, code: int, body: dict):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _refused(self, post: bool) -> bool:
+        """Reply 403 / 415 and return True for a request that may not come from organizer_client."""
+        port = self.server.server_address[1]
+        if self.headers.get("Host") not in (f"127.0.0.1:{port}", f"localhost:{port}"):
+            self._reply(403, {"error": "unexpected Host header"})
+            return True
+        sent = self.headers.get(WORKER_TOKEN_HEADER, "").encode("utf-8")
+        if not self.token or not hmac.compare_digest(sent, self.token.encode("utf-8")):
+            self._reply(403, {"error": f"missing or wrong {WORKER_TOKEN_HEADER} (see the worker's token file)"})
+            return True
+        if post and self.headers.get_content_type() != "application/json":
+            self._reply(415, {"error": "requests must be application/json"})
+            return True
+        return False
+
+    def do_GET(self):
+        if self._refused(post = False):
+            return
+        if self.path == "/status":
+            self._reply(200, {"pid": os.getpid(), "cwd": os.getcwd(), "cached": self.cache.entries()})
+        else:
+            self._reply(404, {"error": f"unknown path {self.path}"})
+
+    def do_POST(self):
+        if self._refused(post = True):
+            return
+        if self.path == "/run":
+            try:
+                job = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                result = run_job(job, self.cache)
+            except Exception as e:
+                finish_run()
+                print(f"job failed: {type(e).__name__}: {e}")
+                self._reply(400, {"error": f"{type(e).__name__}: {e}"})
+                return
+            print(f"job done: {result['output']} ({result['seconds']}s, {result['cache']})")
+            self._reply(200, result)
+        elif self.path == "/clear":
+            self.cache.clear()
+            self._reply(200, {"cached": []})
+        elif self.path == "/shutdown":
+            self._reply(200, {"stopping": True})
+            self.server.stop = True
+        else:
+            self._reply(404, {"error": f"unknown path {self.path}"})
+
+    def log_message(self, format, *args):
+        pass
+
+def serve(port: int = WORKER_PORT, cache_size: int = WORKER_CACHE):
+    WorkerHandler.cache = InputCache(cache_size)
+    server = HTTPServer(("127.0.0.1", port), WorkerHandler)
+    server.stop = False
+    token_file = WORKER_TOKEN_FILE.format(port = port)
+    WorkerHandler.token = write_token_file(token_file)
+    print(f"organizer worker on http://127.0.0.1:{port} (folder {os.getcwd()}, cache {cache_size} files, "
+          f"token {token_file})")
+    try:
+        while not server.stop:
+            server.handle_request()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        WorkerHandler.cache.clear()
+        server.server_close()
+        if os.path.exists(token_file):
+            os.remove(token_file)
+    print("worker stopped")
+
+def main():
+    parser = argparse.ArgumentParser(description="Warm worker for taxa_organized_organizer")
+    parser.add_argument("--port", type=int, default=WORKER_PORT)
+    parser.add_argument("--cache", type=int, default=WORKER_CACHE, help="input files kept parsed")
+    args = parser.parse_args()
+    serve(args.port, args.cache)
+
+
+if __name__ == "__main__":
+    main()
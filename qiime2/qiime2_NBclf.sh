@@ -1,69 +1,177 @@
 #!/bin/bash
 
 #VARIABLES
+SILVA_VERSION=138_99
+
 ARC_FPRIMER=ATTAGATACCCSBGTAGTCC
 ARC_RPRIMER=GCCATGCACCWCCTCT
 
 BAC_FPRIMER=CCAGCAGCCGCGGTAATACG
 BAC_RPRIMER=GACTACCAGGGTATCTAATCC
 
-cd SILVA_DB_138_99
-mkdir classifier
+#extract-reads trimming (qiime defaults, 0 = off)
+TRUNC_LEN=0
+TRIM_LEFT=0
+MIN_LEN=50
+MAX_LEN=0
+IDENTITY=0.8
+DEREP_MODE=uniq
+
+#memory cap of all builds together in GB (default = MemAvailable, 0 = no cap)
+MEM_AVAILABLE_GB=$(awk '/^MemAvailable:/ {print int($2 / 1024 / 1024)}' /proc/meminfo 2>/dev/null)
+MEM_LIMIT_GB=${MEM_LIMIT_GB:-${MEM_AVAILABLE_GB:-0}}
+#peak memory of one domain build in GB (classifier training), ARC and BAC run together only if two fit
+BUILD_MEM_GB=${BUILD_MEM_GB:-16}
+#PARALLEL=0 builds ARC then BAC
+PARALLEL=${PARALLEL:-1}
+
+if [ $PARALLEL = 1 ] && [ $MEM_LIMIT_GB -gt 0 ] && [ $((2 * BUILD_MEM_GB)) -gt $MEM_LIMIT_GB ];then
+	echo "two builds need ${BUILD_MEM_GB}GB each, cap is ${MEM_LIMIT_GB}GB : building ARC then BAC"
+	PARALLEL=0
+fi
+
+#Total cap : the whole script runs in one systemd scope (resident memory of all builds together)
+#without systemd, each build gets its share as a virtual memory limit (ulimit -v, stricter than resident)
+if [ $MEM_LIMIT_GB -gt 0 ] && [ -z "$NBCLF_SCOPE" ] && command -v systemd-run > /dev/null \
+	&& systemd-run --user --scope --quiet true > /dev/null 2>&1;then
+	echo "memory cap ${MEM_LIMIT_GB}GB (systemd scope)"
+	export NBCLF_SCOPE=1 PARALLEL MEM_LIMIT_GB
+	exec systemd-run --user --scope --quiet -p MemoryMax=${MEM_LIMIT_GB}G "$0" "$@"
+fi
+if [ $MEM_LIMIT_GB -gt 0 ] && [ -z "$NBCLF_SCOPE" ];then
+	JOB_MEM_GB=$MEM_LIMIT_GB
+	[ $PARALLEL = 1 ] && JOB_MEM_GB=$((MEM_LIMIT_GB / 2))
+	echo "memory cap ${MEM_LIMIT_GB}GB (ulimit -v ${JOB_MEM_GB}GB per build)"
+else
+	JOB_MEM_GB=0
+fi
+
+QIIME2_DIR=$PWD
+cd SILVA_DB_$SILVA_VERSION
+mkdir -p classifier/cache
 cd classifier
 
 SILVA_DB=../silva-uniq-seqs.qza
 SILVA_TAX=../silva-uniq-tax.qza
 
-EXTRACT_ARC=silva-ARC-extract.qza
-EXTRACT_DEREP_ARC=silva-ARC-uniq-extract.qza
-CLF_ARC=silva-ARC-clf.qza
-EXTRACT_BAC=silva-BAC-extract.qza
-EXTRACT_DEREP_BAC=silva-BAC-uniq-extract.qza
-CLF_BAC=silva-BAC-clf.qza
-
-echo "extract reference read"
-
-qiime feature-classifier extract-reads \
-	--i-sequences $SILVA_DB \
-	--p-f-primer $ARC_FPRIMER \
-	--p-r-primer $ARC_RPRIMER \
-	--o-reads $EXTRACT_ARC
-
-qiime feature-classifier extract-reads \
-	--i-sequences $SILVA_DB \
-	--p-f-primer $BAC_FPRIMER \
-	--p-r-primer $BAC_RPRIMER \
-	--o-reads $EXTRACT_BAC
-
-echo "complete extraction & start dereplicate"
-
-qiime rescript dereplicate \
-    	--i-sequences $EXTRACT_ARC \
-    	--i-taxa $SILVA_TAX \
-    	--p-rank-handles 'silva' \
-    	--p-mode 'uniq' \
-    	--o-dereplicated-sequences $EXTRACT_DEREP_ARC \
-    	--o-dereplicated-taxa  $EXTRACT_DEREP_ARC
-
-qiime rescript dereplicate \
-    	--i-sequences $EXTRACT_BAC \
-    	--i-taxa $SILVA_TAX \
-    	--p-rank-handles 'silva' \
-    	--p-mode 'uniq' \
-    	--o-dereplicated-sequences $EXTRACT_DEREP_BAC \
-    	--o-dereplicated-taxa  $EXTRACT_DEREP_BAC
-    
-echo "complete dereplicate & start classifier training"
-
-qiime feature-classifier fit-classifier-naive-bayes \
-	--i-reference-reads $EXTRACT_DEREP_ARC \
-	--i-reference-taxonomy $SILVA_TAX \
-	--o-classifier $CLF_ARC
-
-qiime feature-classifier fit-classifier-naive-bayes \
-	--i-reference-reads $EXTRACT_DEREP_BAC \
-	--i-reference-taxonomy $SILVA_TAX \
-	--o-classifier $CLF_BAC
+#Tool versions : a classifier trained with another qiime / plugin / scikit-learn version is not reused
+QIIME_VERSIONS=$(qiime info | grep -E '^(QIIME 2 version|feature-classifier|rescript):' | tr '\n' ' ')
+SKLEARN_VERSION=$(python -c 'import sklearn; print(sklearn.__version__)')
+if [ -z "$QIIME_VERSIONS" ] || [ -z "$SKLEARN_VERSION" ];then
+	echo "qiime / scikit-learn versions not found (activate the qiime2 environment)"
+	exit 1
+fi
 
-echo "complete classifier training"
+#Cache key : every input that changes the trained classifier
+#cache/<key>/ holds the extracted reads, dereplicated reads/taxonomy, classifier and manifest.txt
+cache_key() {
+	printf '%s\n' "silva=$SILVA_VERSION" "f=$1" "r=$2" "trunc=$TRUNC_LEN" "trim_left=$TRIM_LEFT" \
+		"min=$MIN_LEN" "max=$MAX_LEN" "identity=$IDENTITY" "derep=$DEREP_MODE" \
+		"qiime=$QIIME_VERSIONS" "sklearn=$SKLEARN_VERSION" \
+		| sha256sum | cut -c1-16
+}
+
+#tmp_of FILE : name a step writes to before it is moved to FILE (keeps .qza, qiime adds it otherwise)
+tmp_of() {
+	echo $(dirname $1)/tmp.$(basename $1)
+}
+
+#build_classifier DOMAIN FPRIMER RPRIMER : steps whose output exists in the cache are skipped
+#outputs are moved into place only when their step succeeded, so an interrupted step is redone
+build_classifier() {
+	local DOMAIN=$1 FPRIMER=$2 RPRIMER=$3
+	local KEY=$(cache_key $FPRIMER $RPRIMER)
+	local DIRR=cache/$KEY
+	local EXTRACT=$DIRR/silva-$DOMAIN-extract.qza
+	local EXTRACT_DEREP=$DIRR/silva-$DOMAIN-uniq-extract.qza
+	local TAX_DEREP=$DIRR/silva-$DOMAIN-uniq-tax.qza
+	local CLF=$DIRR/silva-$DOMAIN-clf.qza
+	mkdir -p $DIRR
+	rm -f $DIRR/tmp.*
 
+	if [ $JOB_MEM_GB -gt 0 ];then
+		ulimit -v $((JOB_MEM_GB * 1024 * 1024)) || return 1
+	fi
+
+	if [ -f $DIRR/manifest.txt ];then
+		echo "$DOMAIN : cached classifier $KEY"
+	else
+		echo "$DOMAIN : building classifier $KEY"
+		if [ ! -f $EXTRACT ];then
+			echo "$DOMAIN : extract reference read"
+			qiime feature-classifier extract-reads \
+				--i-sequences $SILVA_DB \
+				--p-f-primer $FPRIMER \
+				--p-r-primer $RPRIMER \
+				--p-trunc-len $TRUNC_LEN \
+				--p-trim-left $TRIM_LEFT \
+				--p-min-length $MIN_LEN \
+				--p-max-length $MAX_LEN \
+				--p-identity $IDENTITY \
+				--o-reads $(tmp_of $EXTRACT) || return 1
+			mv $(tmp_of $EXTRACT) $EXTRACT
+		fi
+
+		if [ ! -f $EXTRACT_DEREP ] || [ ! -f $TAX_DEREP ];then
+			echo "$DOMAIN : dereplicate"
+			qiime rescript dereplicate \
+				--i-sequences $EXTRACT \
+				--i-taxa $SILVA_TAX \
+				--p-rank-handles 'silva' \
+				--p-mode $DEREP_MODE \
+				--o-dereplicated-sequences $(tmp_of $EXTRACT_DEREP) \
+				--o-dereplicated-taxa $(tmp_of $TAX_DEREP) || return 1
+			mv $(tmp_of $EXTRACT_DEREP) $EXTRACT_DEREP
+			mv $(tmp_of $TAX_DEREP) $TAX_DEREP
+		fi
+
+		if [ ! -f $CLF ];then
+			echo "$DOMAIN : classifier training"
+			qiime feature-classifier fit-classifier-naive-bayes \
+				--i-reference-reads $EXTRACT_DEREP \
+				--i-reference-taxonomy $TAX_DEREP \
+				--o-classifier $(tmp_of $CLF) || return 1
+			mv $(tmp_of $CLF) $CLF
+		fi
+
+		{
+			echo "key=$KEY"
+			echo "domain=$DOMAIN"
+			echo "silva=$SILVA_VERSION"
+			echo "f_primer=$FPRIMER"
+			echo "r_primer=$RPRIMER"
+			echo "trunc_len=$TRUNC_LEN trim_left=$TRIM_LEFT min_length=$MIN_LEN max_length=$MAX_LEN identity=$IDENTITY"
+			echo "derep_mode=$DEREP_MODE"
+			echo "qiime=$QIIME_VERSIONS"
+			echo "sklearn=$SKLEARN_VERSION"
+			echo "created=$(date '+%Y-%m-%d %H:%M:%S')"
+			echo "sha256=$(sha256sum $CLF | cut -d' ' -f1)"
+		} > $DIRR/tmp.manifest.txt && mv $DIRR/tmp.manifest.txt $DIRR/manifest.txt
+	fi
+
+	#path used by qiime2_analysis.sh, manifest next to it
+	ln -sf $PWD/$CLF $QIIME2_DIR/silva_16S_${DOMAIN}_classifier.qza
+	cp $DIRR/manifest.txt $QIIME2_DIR/silva_16S_${DOMAIN}_classifier.manifest.txt
+	echo "$DOMAIN : complete ($QIIME2_DIR/silva_16S_${DOMAIN}_classifier.qza)"
+}
+
+if [ $PARALLEL = 1 ];then
+	#ARC / BAC in parallel, each in its own subshell (half of the cap without systemd)
+	( build_classifier ARC $ARC_FPRIMER $ARC_RPRIMER ) > ARC.log 2>&1 &
+	PID_ARC=$!
+	( build_classifier BAC $BAC_FPRIMER $BAC_RPRIMER ) > BAC.log 2>&1 &
+	PID_BAC=$!
+	echo "building ARC / BAC classifiers (logs : $PWD/ARC.log, $PWD/BAC.log)"
+	wait $PID_ARC; STATUS_ARC=$?
+	wait $PID_BAC; STATUS_BAC=$?
+	cat ARC.log BAC.log
+else
+	( build_classifier ARC $ARC_FPRIMER $ARC_RPRIMER ); STATUS_ARC=$?
+	( build_classifier BAC $BAC_FPRIMER $BAC_RPRIMER ); STATUS_BAC=$?
+fi
+
+if [ $STATUS_ARC != 0 ] || [ $STATUS_BAC != 0 ];then
+	echo "classifier build failed (ARC : $STATUS_ARC, BAC : $STATUS_BAC)"
+	exit 1
+fi
+echo "complete classifier training"
@@ -31,6 +31,11 @@ else
 	FILTER=Archaea
 fi
 echo "$CLF"
+#classifier built by qiime2_NBclf.sh : keep its manifest (SILVA release, primers, trimming) with the results
+if [ -f ${CLF%.qza}.manifest.txt ];then
+	cp ${CLF%.qza}.manifest.txt classifier-manifest.txt
+	cat classifier-manifest.txt
+fi
 
 echo "start classification"
 
@@ -0,0 +1,46 @@
+import pandas as pd
+from functions.CombinedDomains import RATIO_SHEET, DomainWorkbooks, load_union_metadata, paired_keys, ratio_table
+from functions.ProcessHelper import build_site_header_row
+from functions.ProcessSheet import process_sheets_pipelined
+from functions.config import EXCEL_IN_ARC, EXCEL_IN_BAC, METADATA_ARC, METADATA_BAC, EXCEL_OUT, \
+    OUTPUT_FORMAT, PREFETCH_DEPTH, PAIR_KEY
+from functions.Renderers import open_renderer
+from functions.PromptValues import get_user_sort_spec_from_metadata,compute_global_sample_order
+from functions.StageProfiler import start_run, stage, finish_run
+
+def main():
+    # Stage timing / memory log (enable with NGS_PROFILE=1)
+    start_run("taxa_combined_organizer")
+    # ARC + BAC metadata read once, samples paired on their ID without ARC / BAC (or NGS_PAIR_KEY)
+    meta_df, pair_ids = load_union_metadata({"ARC": METADATA_ARC, "BAC": METADATA_BAC}, pair_key = PAIR_KEY)
+
+    # Prompt ONCE, build global order ONCE over both domains
+    sort_spec = get_user_sort_spec_from_metadata(meta_df, sampleid_col="sampleid")
+    with stage("global sample order"):
+        global_order = compute_global_sample_order(meta_df, sort_spec, sampleid_col="sampleid")
+    keys = paired_keys(pair_ids, global_order)
+    if not keys:
+        paired_on = f"'{PAIR_KEY}'" if PAIR_KEY else "sample ID without ARC / BAC"
+        print(f"no ARC / BAC samples paired on {paired_on}: writing the per-domain sheets only")
+
+    with stage("open workbook"):
+        workbooks = DomainWorkbooks({"ARC": EXCEL_IN_ARC, "BAC": EXCEL_IN_BAC}, pair_ids, keys)
+    renderer = open_renderer(OUTPUT_FORMAT, EXCEL_OUT)
+    # <rank>_ARC, <rank>_BAC, <rank>_ALL sheets through the same pipeline as taxa_organized_organizer
+    process_sheets_pipelined(workbooks, workbooks.sheet_names, renderer, global_order, meta_df,
+                             depth = PREFETCH_DEPTH, read_pair = workbooks.read_pair)
+    if keys:
+        with stage("ratio sheet") as st:
+            ratio = build_site_header_row(ratio_table(workbooks.totals, pair_ids, keys), meta_df)
+            renderer.write(RATIO_SHEET, ratio, "Archaea : Bacteria", {})
+            st.shape(ratio)
+    with stage("save output"):
+        renderer.close()
+
+    finish_run()
+    print("DONE")
+    print("Output:", EXCEL_OUT, "format:", OUTPUT_FORMAT)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,38 @@
 import pandas as pd
-import numpy as np
-from functions.ProcessSheet import process_sheet
-from functions.config import EXCEL_IN, EXCEL_OUT, METADATA
+from functions import config
+from functions.ProcessSheet import process_sheets_pipelined, load_metadata, list_target_sheets
+from functions.config import OUTPUT_FORMAT, PREFETCH_DEPTH
+from functions.Renderers import open_renderer
 from functions.PromptValues import get_user_sort_spec_from_metadata,compute_global_sample_order
-
-def list_target_sheets(xf):
-    """Sheets to process: those containing '(%)'."""
-    return [s for s in xf.sheet_names if "rank(%)" in s]
+from functions.StageProfiler import start_run, stage, finish_run
 
 def main():
-    xf = pd.ExcelFile(EXCEL_IN)
-    sheets = list_target_sheets(xf)
-    meta_df = pd.read_csv(METADATA, sep="\t", dtype=str)
-    
+    # Stage timing / memory log (enable with NGS_PROFILE=1)
+    start_run("taxa_organized_organizer")
+    # paths are prompted on first use (see config): input workbook, metadata, then output name
+    excel_in = config.EXCEL_IN
+    with stage("open workbook"):
+        xf = pd.ExcelFile(excel_in)
+        sheets = list_target_sheets(xf)
+    # metadata read and checked once (duplicate IDs, samples missing on either side, unknown sites)
+    meta_df = load_metadata()
+    meta_df.report(table_samples = xf.parse(sheets[0], nrows = 0).columns[1:] if sheets else None)
+
     # Prompt ONCE, build global order ONCE
     sort_spec = get_user_sort_spec_from_metadata(meta_df, sampleid_col="sampleid")
-    global_order = compute_global_sample_order(meta_df, sort_spec, sampleid_col="sampleid")
-    with pd.ExcelWriter(EXCEL_OUT, engine="xlsxwriter") as writer:
-        for sheet in sheets:
-            process_sheet(xf, sheet, writer, global_sample_order = global_order)
+    with stage("global sample order"):
+        global_order = compute_global_sample_order(meta_df, sort_spec, sampleid_col="sampleid")
+    # xlsx by default; NGS_OUTPUT_FORMAT=tsv,parquet,html skips Excel for automated runs
+    excel_out = config.EXCEL_OUT
+    renderer = open_renderer(OUTPUT_FORMAT, excel_out)
+    # one sheet at a time unless NGS_PREFETCH_DEPTH > 0 (see config)
+    process_sheets_pipelined(xf, sheets, renderer, global_order, meta_df, depth = PREFETCH_DEPTH)
+    with stage("save output"):
+        renderer.close()
 
+    finish_run()
     print("DONE")
-    print("Output Excel:", EXCEL_OUT)
+    print("Output:", excel_out, "format:", OUTPUT_FORMAT)
 
 
 if __name__ == "__main__":
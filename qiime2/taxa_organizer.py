@@ -9,6 +9,19 @@ import pandas as pd
 from tkinter import filedialog
 import numpy as np
 import os
+from functions.BetaDiversity import distance_matrix_from_rank_table, distance_sheet_name, write_distance_matrices
+from functions.OrganizeHelper import split_lineage, build_otus, build_organized_sheets, read_previous_tables, \
+    save_tables, write_organized_workbook, append_batch, sample_columns, LineageIndex, Number_name
+from functions.ProcessHelper import find_read_sheet_name
+from functions.ProcessSheet import process_sheets_pipelined
+from functions.PromptValues import get_user_sort_spec_from_metadata, compute_global_sample_order
+from functions.Renderers import open_renderer
+from functions.config import OUTPUT_FORMAT, PREFETCH_DEPTH
+from functions.StageProfiler import start_run, stage, finish_run
+from functions.Metadata import SampleMetadata
+
+#new : build the workbook from scratch / append : add a new batch to a previous workbook
+mode = input("mode (new / append):").strip().lower() or 'new'
 
 #CSV file download from 'silva_16S_barplot.qzv' with Taxonomic level 7
 domain = input("input domain that you want to create file for (ARC / BAC):")
@@ -22,86 +35,118 @@ table = "../result/"+domain+"/metadata.tsv"
 
 name= 'sampleid'
 
-namemap = pd.read_csv(metadata, sep = '\t', index_col = 0)
-namemap = namemap.sort_values(by=name)
-namemap = namemap.astype('str')
-#namemap.loc[namemap['reactor'] == 'r2', 'days'] = namemap.loc[namemap['reactor'] == 'r2', 'days'] + '-2'
-namemap_columns = len(namemap.columns)
-
-data = pd.read_csv(filename, index_col = 0 , na_values= ['',' - ']).T
-data = data.iloc[:-namemap_columns]
-data.index = data.index.astype('str')
-name_split = data.index.str.split(";")
-data = data.astype('int')
-
-
-col_names = ['Domain', 'Phylum', 'Class', 'Order', 'Family', 'Genus', 'Species']
-for col, i in zip(col_names, range(0,7)):
-    data.insert(i, col, name_split.str.get(i))
-    data[col] = data[col].str.split('__').str[1]
-data = data.replace('', np.NaN)
-reads = data.iloc[:, 7:]
-row_count = reads.iloc[:,-1].count()
-
-unid = ['uncultured', 'unidentified', 'Ambiguous', 'metagenome', 'Unknown', 'group']
-for j in range(0, 7):
-    for i in range(0, row_count):
-        if any(f in str(data.iloc[i,j]) for f in unid):
-            data.iloc[i,j] = 'unidentified'
-            
-data = data.fillna('unidentified')
-data.reset_index(inplace = True)
-data = data.replace(to_replace = ';', value = '; ', regex = True)
-
-ASV = pd.read_csv(table, sep = '\t')[1:]
-OUT = pd.concat([ASV, data],axis = 1, join= 'inner')
-OUT.drop(['Confidence', 'index', 'Taxon'], axis = 1, inplace = True)
+#Stage timing / memory log (enable with NGS_PROFILE=1)
+start_run('taxa_organizer')
 
-if not os.path.exists('taxa-organized'):
-    os.makedirs('taxa-organized')
+with stage('read metadata') as st:
+    namemap = SampleMetadata.read(metadata, sampleid_col = name)
+    #metadata columns appended at the end of the level-7 CSV
+    namemap_columns = len(namemap.columns)
+    st.shape(namemap.frame)
+
+with stage('parse level-7') as st:
+    data = pd.read_csv(filename, index_col = 0 , na_values= ['',' - ']).T
+    data = data.iloc[:-namemap_columns]
+    data.index = data.index.astype('str')
+    data = data.astype('int')
+    st.shape(data)
 
-file = 'taxa-organized/' + input("file name (add .xlsx): ")
-OUT.to_excel(excel_writer=file, sheet_name = "OTUs", index = False)
-
-OUT = pd.read_excel(file, index_col = 0, na_values= ['',' - ',0])
-
-reads = OUT.iloc[:, 7:]
-reads_sum = reads.sum(axis = 0).to_frame()
-row_count = reads.iloc[:,-1].count()
-col_count = reads.count(1)[1]
-
-Number = range(1,7)
-Name = ['P_read', 'C_read', 'O_read', 'F_read', 'G_read', 'S_read']
-Name_per = ['P(%)', 'C(%)', 'O(%)', 'F(%)', 'G(%)', 'S(%)']
-Name_major=['P_rank(%)', 'C_rank(%)', 'O_rank(%)', 'F_rank(%)', 'G_rank(%)', 'S_rank(%)']
-Number_name = list(zip(Number, Name, Name_per, Name_major))
-
-
-def num_to_per(df1, df2, row_count, col_count, r_sum):
-    for i in range(0, row_count):
-        for j in range(1, col_count+1):
-            per = df1.iloc[i,j]/r_sum.iloc[j-1][0]*100
-            df2.iloc[i,j] = round(per,3)
-    return (df2)
-
-def drop_minor(df):
-    for idx, row in df.iterrows():
-        if row.max() < 1:
-            df.drop(idx, inplace = True)
-    return (df)
-        
-
-for i, j, p, r in Number_name:
-    new1 = pd.merge(OUT.iloc[:, i], reads, left_index = True, right_index = True, how = 'left')
-    new2 = new1.copy()
-    new2 = num_to_per(new1, new2, row_count, col_count, reads_sum)
-    new1 = new1.groupby(new1.iloc[:,0]).sum()
-    new2 = new2.groupby(new2.iloc[:,0]).sum()
-    new3 = new2.copy()
-    new3 = drop_minor(new3)
-    with pd.ExcelWriter(file, mode = 'a', engine = 'openpyxl') as writer:
-        new1.to_excel(writer, sheet_name = j)
-        new2.to_excel(writer, sheet_name = p)
-        new3.to_excel(writer, sheet_name = r)
+with stage('split lineage') as st:
+    data = split_lineage(data)
+    st.shape(data)
 
+if not os.path.exists('taxa-organized'):
+    os.makedirs('taxa-organized')
 
+#Taxonomy TSV (Feature ID / Taxon): representative Feature ID of each lineage in the OTUs sheet
+with stage('read taxonomy') as st:
+    taxonomy = pd.read_csv(table, sep = '\t')
+    st.shape(taxonomy)
+
+#Incremental mode: merge the new batch into the previous tables on the lineage,
+#only the new sample columns are aggregated / converted to percentages.
+#Both modes build the OTUs table and rank sheets with the same functions (append = rebuild)
+if mode == 'append':
+    prev_file = 'taxa-organized/' + input("previous file name (add .xlsx): ")
+    file = 'taxa-organized/' + input("file name (add .xlsx): ")
+    #previous tables from the sidecar saved with the workbook (the xlsx is parsed only without it)
+    with stage('load previous tables') as st:
+        prev_sheets, prev_source = read_previous_tables(prev_file)
+        st.shape(prev_sheets['OTUs'])
+    print("previous tables :", prev_source)
+    with stage('build OTUs') as st:
+        OUT = build_otus(data, taxonomy)
+        st.shape(OUT)
+    with stage('merge batch') as st:
+        sheets = append_batch(prev_sheets, OUT)
+        st.shape(sheets['OTUs'])
+
+else:
+    file = 'taxa-organized/' + input("file name (add .xlsx): ")
+
+    with stage('build OTUs') as st:
+        OUT = build_otus(data, taxonomy)
+        st.shape(OUT)
+
+    #Lineage index built once: every rank sheet is a roll-up of the same rows
+    with stage('lineage index') as st:
+        index = LineageIndex.from_frame(OUT)
+        st.shape(OUT)
+
+    with stage('rank roll-up') as st:
+        sheets = {'OTUs': OUT, **build_organized_sheets(OUT, index = index)}
+        st.shape(OUT)
+
+#metadata checked against every sample of the workbook (previous + new batch in append mode)
+namemap.report(table_samples = sample_columns(sheets['OTUs']))
+read_tables = {j: sheets[j] for i, j, p, r in Number_name}
+
+#Optional beta-diversity (Bray-Curtis / Jaccard) between samples on rank tables
+ranks = input("ranks for distance matrices (e.g. G,S / blank to skip): ").replace(' ', '')
+matrices = {}
+fmt = 'xlsx'
+if ranks:
+    fmt = input("distance output format (xlsx / npz): ").strip().lower() or 'xlsx'
+    for rank in ranks.split(','):
+        j = rank.upper() + '_read'
+        if j not in read_tables:
+            print("unknown rank :", rank)
+            continue
+        for metric in ['braycurtis', 'jaccard']:
+            with stage('distance matrix') as st:
+                matrices[distance_sheet_name(j, metric)] = distance_matrix_from_rank_table(read_tables[j], metric)
+                st.shape(read_tables[j])
+
+#one xlsxwriter pass, with the distance sheets when they go to the workbook
+with stage('write excel') as st:
+    write_organized_workbook(file, {**sheets, **matrices} if fmt == 'xlsx' else sheets)
+    st.shape(sheets['OTUs'])
+if matrices and fmt != 'xlsx':
+    with stage('write distances'):
+        print("distance matrices saved :", write_distance_matrices(matrices, file, fmt))
+elif matrices:
+    print("distance matrices saved :", file)
+
+#*_read / *(%) tables for the next append (saved after the workbook, see read_previous_tables)
+with stage('save tables') as st:
+    print("tables saved :", save_tables(file, sheets))
+    st.shape(sheets['OTUs'])
+
+#Optional formatted report (step 8) from the tables in memory, without re-reading the workbook
+report = input("formatted report file name (step 8, add .xlsx / blank to skip): ").strip()
+if report:
+    if not os.path.exists('ngs-organized'):
+        os.makedirs('ngs-organized')
+    sort_spec = get_user_sort_spec_from_metadata(namemap, sampleid_col = name)
+    with stage('global sample order'):
+        global_order = compute_global_sample_order(namemap, sort_spec, sampleid_col = name)
+    renderer = open_renderer(OUTPUT_FORMAT, 'ngs-organized/' + report)
+    rank_sheets = [r for i, j, p, r in Number_name]
+    process_sheets_pipelined(None, rank_sheets, renderer, global_order, namemap, depth = PREFETCH_DEPTH,
+                             read_pair = lambda sheet: (sheets[sheet].reset_index(),
+                                                        sheets[find_read_sheet_name(sheet)].reset_index()))
+    with stage('save output'):
+        renderer.close()
+    print("formatted report :", 'ngs-organized/' + report, "format:", OUTPUT_FORMAT)
+
+finish_run()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# modules import each other as `functions.X` (scripts run from the qiime2 folder)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,68 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import make_lineages, make_counts
+from functions.OrganizeHelper import split_lineage, build_otus, build_organized_sheets, append_batch, \
+    save_tables, load_tables, read_previous_tables, read_previous_workbook, LINEAGE_COLUMNS
+
+
+def batch(level7: pd.DataFrame, samples):
+    """Level-7 table of some samples, with only the lineages they contain (as QIIME 2 writes it)."""
+    sub = level7[samples]
+    return split_lineage(sub[sub.sum(axis=1) > 0])
+
+
+def dataset():
+    rng = np.random.default_rng(3)
+    lineages = make_lineages(300, rng)
+    counts = make_counts(300, 24, 0.7, rng)
+    samples = [f"S{i}" for i in range(24)]
+    level7 = pd.DataFrame(counts, index=lineages, columns=samples).groupby(level=0, sort=False).sum()
+    taxonomy = pd.DataFrame({"Feature ID": [f"f{i}" for i in range(300)], "Taxon": lineages})
+    return level7, taxonomy, samples, counts
+
+
+def test_append_equals_rebuild():
+    level7, taxonomy, samples, counts = dataset()
+
+    full_otus = build_otus(batch(level7, samples), taxonomy)
+    full = {"OTUs": full_otus, **build_organized_sheets(full_otus)}
+
+    prev_otus = build_otus(batch(level7, samples[:16]), taxonomy)
+    prev = {"OTUs": prev_otus, **build_organized_sheets(prev_otus)}
+    appended = append_batch(prev, build_otus(batch(level7, samples[16:]), taxonomy))
+
+    assert list(appended) == list(full)
+    for sheet in full:
+        expected, got = full[sheet], appended[sheet]
+        if sheet == "OTUs":
+            expected = expected.reset_index().set_index(LINEAGE_COLUMNS).sort_index()
+            got = got.reset_index().set_index(LINEAGE_COLUMNS).sort_index()
+        pd.testing.assert_frame_equal(got[expected.columns], expected, check_dtype=False, check_names=False)
+    assert appended["OTUs"][samples].sum().sum() == counts.sum()
+
+
+def test_saved_tables_match_workbook(tmp_path):
+    level7, taxonomy, samples, _ = dataset()
+    otus = build_otus(batch(level7, samples), taxonomy)
+    sheets = {"OTUs": otus, **build_organized_sheets(otus)}
+    workbook = str(tmp_path / "a.xlsx")
+    with pd.ExcelWriter(workbook, engine="xlsxwriter") as writer:
+        for sheet, df in sheets.items():
+            df.to_excel(writer, sheet_name=sheet)
+
+    parsed = read_previous_workbook(workbook)
+    path = save_tables(workbook, sheets)
+    loaded, source = read_previous_tables(workbook)
+    assert source == path
+    assert list(loaded) == list(parsed)
+    for sheet in parsed:
+        pd.testing.assert_frame_equal(loaded[sheet], parsed[sheet])
+        pd.testing.assert_frame_equal(load_tables(path)[sheet], sheets[sheet])
+
+    # workbook saved again after its tables (e.g. edited in Excel): parsed from the xlsx
+    later = os.path.getmtime(path) + 10
+    os.utime(workbook, (later, later))
+    assert read_previous_tables(workbook)[1] == workbook
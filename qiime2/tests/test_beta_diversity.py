@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from functions import BetaDiversity
+from functions.BetaDiversity import pairwise_distances, distance_matrix_from_rank_table
+
+
+def brute_braycurtis(X):
+    n = len(X)
+    d = np.zeros((n, n))
+    for i in range(n):
+        for j in range(n):
+            denom = (X[i] + X[j]).sum()
+            d[i, j] = np.abs(X[i] - X[j]).sum() / denom if denom else 0.0
+    return d
+
+
+def brute_jaccard(X):
+    n = len(X)
+    d = np.zeros((n, n))
+    for i in range(n):
+        for j in range(n):
+            a, b = X[i] > 0, X[j] > 0
+            union = (a | b).sum()
+            d[i, j] = 1.0 - (a & b).sum() / union if union else 0.0
+    return d
+
+
+@pytest.fixture
+def counts():
+    rng = np.random.default_rng(7)
+    X = rng.integers(0, 50, size=(23, 40)).astype(float)
+    X[rng.random(X.shape) < 0.6] = 0
+    X[4] = 0  # empty sample
+    X[11] = 0  # two empty samples are identical
+    return X
+
+
+@pytest.mark.parametrize("block_size", [1, 5, 256])
+@pytest.mark.parametrize("n_jobs", [1, 3])
+def test_braycurtis_matches_brute_force(counts, block_size, n_jobs):
+    d = pairwise_distances(counts, "braycurtis", block_size=block_size, n_jobs=n_jobs)
+    np.testing.assert_allclose(d, brute_braycurtis(counts), atol=1e-12)
+
+
+def test_braycurtis_taxa_chunks(counts, monkeypatch):
+    # a tiny budget splits the taxa into many chunks
+    monkeypatch.setattr(BetaDiversity, "MEMORY_BUDGET_BYTES", 5 * 5 * 8 * 3)
+    d = pairwise_distances(counts, "braycurtis", block_size=5, n_jobs=2)
+    np.testing.assert_allclose(d, brute_braycurtis(counts), atol=1e-12)
+
+
+@pytest.mark.parametrize("block_size", [1, 5, 256])
+@pytest.mark.parametrize("n_jobs", [1, 3])
+def test_jaccard_matches_brute_force(counts, block_size, n_jobs):
+    d = pairwise_distances(counts, "jaccard", block_size=block_size, n_jobs=n_jobs)
+    np.testing.assert_allclose(d, brute_jaccard(counts), atol=1e-12)
+
+
+def test_rank_table_labels_and_nan(counts):
+    table = pd.DataFrame(counts.T, columns=[f"s{i}" for i in range(len(counts))])
+    table.iloc[0, 0] = np.nan
+    table.insert(0, "Genus", [f"g{i}" for i in range(len(table))])
+    dm = distance_matrix_from_rank_table(table, "braycurtis", block_size=4)
+    assert list(dm.index) == list(dm.columns) == list(table.columns[1:])
+    expected = counts.copy()
+    expected[0, 0] = 0
+    np.testing.assert_allclose(dm.to_numpy(), brute_braycurtis(expected), atol=1e-12)
+
+
+def test_unknown_metric(counts):
+    with pytest.raises(ValueError):
+        pairwise_distances(counts, "euclidean")
@@ -0,0 +1,53 @@
+import pandas as pd
+import pytest
+
+from functions.CombinedDomains import domain_pair_key, load_union_metadata, paired_keys, ratio_table
+from functions.ProcessHelper import build_site_header_row
+from functions.Renderers import ParquetRenderer
+
+
+@pytest.fixture
+def metadata_paths(tmp_path):
+    paths = {}
+    for domain, ids in [("ARC", ["CJU-0d-ARC", "CJU-7d-ARC", "ARC-HAN-0d"]),
+                        ("BAC", ["CJU-0d-BAC", "CJU-7d-BAC", "BAC-HAN-0d", "GEO-0d-BAC"])]:
+        path = tmp_path / f"sample-metadata-{domain.lower()}.tsv"
+        pd.DataFrame({"sampleid": ids, "site": [i.split("-")[-2] for i in ids],
+                      "round": ["1"] * len(ids)}).to_csv(path, sep="\t", index=False)
+        paths[domain] = str(path)
+    return paths
+
+
+@pytest.mark.parametrize("sample_id, domain, key", [
+    ("CJU-0d-ARC", "ARC", "CJU-0d"),
+    ("DGGB-r3-BAC-0007", "BAC", "DGGB-r3-0007"),
+    ("arc_S01", "ARC", "S01"),
+    ("BACTERIA-1", "BAC", "BACTERIA-1"),  # token only as a whole part
+    ("S01", "BAC", "S01"),
+])
+def test_domain_pair_key(sample_id, domain, key):
+    assert domain_pair_key(sample_id, domain) == key
+
+
+def test_pairs_on_id_without_domain(metadata_paths):
+    meta, pair_ids = load_union_metadata(metadata_paths)
+    assert pair_ids["ARC"]["CJU-0d-ARC"] == pair_ids["BAC"]["CJU-0d-BAC"] == "CJU-0d"
+    assert sorted(paired_keys(pair_ids, [])) == ["CJU-0d", "CJU-7d", "HAN-0d"]
+    # each pair key gets a metadata row for the combined sheets
+    assert {"CJU-0d", "CJU-7d", "HAN-0d"} <= set(meta.sample_ids)
+    assert meta.lookup("site", ["CJU-7d"])[0] == "7d"
+
+
+def test_ratio_sheet_to_parquet(metadata_paths, tmp_path):
+    meta, pair_ids = load_union_metadata(metadata_paths)
+    keys = paired_keys(pair_ids, [])
+    totals = {d: pd.Series(100.0, index=list(ids)) for d, ids in pair_ids.items()}
+    ratio = build_site_header_row(ratio_table(totals, pair_ids, keys), meta)
+
+    renderer = ParquetRenderer(str(tmp_path / "out_parquet"))
+    renderer.write("ARC_BAC_ratio", ratio, "Archaea : Bacteria", {})
+    table = pd.read_parquet(tmp_path / "out_parquet" / "ARC_BAC_ratio.parquet")
+    assert table["Domain"].tolist() == ["ARC reads", "BAC reads", "ARC:BAC", "ARC (%)"]
+    assert table.loc[2, keys].tolist() == [1.0] * len(keys)
+    samples = pd.read_parquet(tmp_path / "out_parquet" / "ARC_BAC_ratio.samples.parquet")
+    assert samples["sample"].tolist() == keys
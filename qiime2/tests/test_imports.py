@@ -0,0 +1,15 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+QIIME2_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# modules used without a display (create_metadata.py, the warm worker) must not need Tk
+@pytest.mark.parametrize("module", ["functions.config", "functions.Metadata", "functions.ProcessSheet",
+                                    "functions.InputCache", "organizer_client"])
+def test_no_tkinter_on_import(module):
+    code = f"import sys, {module}; sys.exit('tkinter' in sys.modules)"
+    assert subprocess.run([sys.executable, "-c", code], cwd=QIIME2_DIR).returncode == 0
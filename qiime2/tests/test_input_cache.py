@@ -0,0 +1,37 @@
+import pandas as pd
+
+from functions.InputCache import InputCache
+
+
+def write_workbook(path, n_samples=3):
+    pct = pd.DataFrame({"Genus": ["A", "B"], **{f"s{i}": [60.0, 40.0] for i in range(n_samples)}})
+    reads = pd.DataFrame({"Genus": ["A", "B"], **{f"s{i}": [6, 4] for i in range(n_samples)}})
+    with pd.ExcelWriter(path, engine="openpyxl") as writer:
+        for name, df in [("G_read", reads), ("G(%)", pct), ("G_rank(%)", pct), ("P_read", reads), ("P_rank(%)", pct)]:
+            df.to_excel(writer, sheet_name=name, index=False)
+    return str(path)
+
+
+def test_workbook_closed_once_parsed(tmp_path):
+    cache = InputCache(size=2)
+    wb, hit = cache.get_workbook(write_workbook(tmp_path / "a.xlsx"))
+    assert not hit and wb.xf is not None
+    df, read_df = wb.read_pair("G_rank(%)")
+    assert wb.xf is not None  # P_rank(%) still to parse
+    wb.read_pair("P_rank(%)")
+    assert wb.xf is None
+    assert wb.read_pair("G_rank(%)")[0] is df
+    assert cache.get_workbook(str(tmp_path / "a.xlsx")) == (wb, True)
+
+
+def test_lru_bound_and_close_on_evict(tmp_path):
+    paths = [write_workbook(tmp_path / f"{name}.xlsx") for name in "abc"]
+    cache = InputCache(size=2)
+    a, _ = cache.get_workbook(paths[0])
+    b, _ = cache.get_workbook(paths[1])
+    cache.get_workbook(paths[0])  # a is now the most recently used
+    cache.get_workbook(paths[2])
+    assert [e["path"] for e in cache.entries()] == [paths[0], paths[2]]
+    assert b.xf is None and a.xf is not None
+    cache.clear()
+    assert a.xf is None and cache.entries() == []
@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from functions.LineageIndex import LINEAGE_COLUMNS, LineageIndex
+
+LINEAGES = [
+    ("Bacteria", "Firmicutes", "Bacilli", "Lactobacillales", "unidentified", "unidentified", "unidentified"),
+    ("Bacteria", "Firmicutes", "Clostridia", "unidentified", "unidentified", "unidentified", "unidentified"),
+    ("Bacteria", "Proteobacteria", "unidentified", "unidentified", "unidentified", "unidentified", "unidentified"),
+    ("Bacteria", "Firmicutes", "Bacilli", "Bacillales", "Bacillaceae", "Bacillus", "unidentified"),
+    ("Archaea", "Euryarchaeota", "unidentified", "unidentified", "unidentified", "unidentified", "unidentified"),
+    ("Bacteria", "Firmicutes", "Bacilli", "Lactobacillales", "unidentified", "unidentified", "unidentified"),
+]
+
+
+@pytest.fixture
+def frame():
+    rng = np.random.default_rng(3)
+    df = pd.DataFrame(LINEAGES, columns=LINEAGE_COLUMNS)
+    counts = pd.DataFrame(rng.integers(0, 100, size=(len(df), 4)), columns=["s1", "s2", "s3", "s4"])
+    return df, counts
+
+
+def brute_rows_under(df, path):
+    mask = np.ones(len(df), dtype=bool)
+    for col, label in zip(LINEAGE_COLUMNS, path):
+        mask &= (df[col] == label).to_numpy()
+    return np.flatnonzero(mask)
+
+
+@pytest.mark.parametrize("rank", LINEAGE_COLUMNS)
+@pytest.mark.parametrize("as_float", [False, True])
+def test_rollup_matches_groupby(frame, rank, as_float):
+    df, counts = frame
+    if as_float:
+        counts = counts / 7.0
+        counts.iloc[2, 1] = np.nan
+    index = LineageIndex.from_frame(df)
+    expected = counts.groupby(df[rank].to_numpy()).sum()
+    got = index.rollup(counts, rank)
+    assert list(got.index) == list(expected.index)
+    np.testing.assert_array_equal(got.to_numpy(), expected.to_numpy())
+
+
+@pytest.mark.parametrize("path", [
+    ("Bacteria",),
+    ("Bacteria", "Firmicutes"),
+    ("Bacteria", "Firmicutes", "Bacilli", "Lactobacillales"),
+    # 'unidentified' under different parents are different clades
+    ("Bacteria", "Firmicutes", "Clostridia", "unidentified"),
+    ("Bacteria", "Proteobacteria", "unidentified"),
+    ("Archaea", "Euryarchaeota", "unidentified", "unidentified", "unidentified", "unidentified", "unidentified"),
+])
+def test_rows_under_matches_mask(frame, path):
+    df, _ = frame
+    index = LineageIndex.from_frame(df)
+    np.testing.assert_array_equal(np.sort(index.rows_under(path)), brute_rows_under(df, path))
+    assert index.node_of(path) >= 0
+
+
+@pytest.mark.parametrize("path", [
+    ("Archaea", "Firmicutes"),
+    ("Bacteria", "Proteobacteria", "Bacilli"),
+    ("Fungi",),
+])
+def test_rows_under_unknown_clade(frame, path):
+    df, _ = frame
+    index = LineageIndex.from_frame(df)
+    assert index.node_of(path) == -1
+    assert len(index.rows_under(path)) == 0
+
+
+def test_trie_parents(frame):
+    df, _ = frame
+    index = LineageIndex.from_frame(df)
+    genus = LINEAGE_COLUMNS.index("Genus")
+    for row in range(len(df)):
+        node = index.path_codes[row, genus]
+        assert index.rank_labels[genus][index.node_label[genus][node]] == df.loc[row, "Genus"]
+        assert index.parent[genus][node] == index.path_codes[row, genus - 1]
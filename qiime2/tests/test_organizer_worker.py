@@ -0,0 +1,59 @@
+import http.client
+import json
+import os
+import stat
+import threading
+from http.server import HTTPServer
+
+import pytest
+
+from functions.InputCache import InputCache
+from organizer_worker import WorkerHandler, write_token_file
+
+
+@pytest.fixture
+def worker(tmp_path):
+    WorkerHandler.cache = InputCache(1)
+    WorkerHandler.token = write_token_file(str(tmp_path / "worker.token"))
+    server = HTTPServer(("127.0.0.1", 0), WorkerHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server.server_address[1], WorkerHandler.token
+    server.shutdown()
+    server.server_close()
+
+
+def post(port, path, headers, body=b"{}"):
+    conn = http.client.HTTPConnection("127.0.0.1", port)
+    conn.request("POST", path, body=body, headers=headers)
+    resp = conn.getresponse()
+    status, data = resp.status, json.loads(resp.read())
+    conn.close()
+    return status, data
+
+
+def test_token_file_owner_only(tmp_path):
+    path = str(tmp_path / "worker.token")
+    token = write_token_file(path)
+    assert write_token_file(path) != token  # new token per start
+    if os.name == "posix":
+        assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+
+
+def test_json_with_token_accepted(worker):
+    port, token = worker
+    status, data = post(port, "/clear", {"Content-Type": "application/json", "X-Worker-Token": token})
+    assert (status, data) == (200, {"cached": []})
+
+
+@pytest.mark.parametrize("headers, with_token, status", [
+    ({"Content-Type": "text/plain"}, True, 415),  # simple cross-site form / fetch POST
+    ({"Content-Type": "application/json"}, False, 403),
+    ({"Content-Type": "application/json", "X-Worker-Token": "guess"}, False, 403),
+    ({"Content-Type": "application/json", "Host": "attacker.example"}, True, 403),  # DNS rebinding
+])
+def test_refused(worker, headers, with_token, status):
+    port, token = worker
+    if with_token:
+        headers = {**headers, "X-Worker-Token": token}
+    assert post(port, "/run", headers, b'{"excel_in": "x.xlsx"}')[0] == status
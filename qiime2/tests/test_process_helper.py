@@ -0,0 +1,9 @@
+import pytest
+
+from functions.ProcessHelper import check_minor_threshold
+
+
+def test_minor_threshold_below_organizer_cut():
+    assert check_minor_threshold(2.5) == 2.5
+    with pytest.raises(ValueError, match="at least 1%"):
+        check_minor_threshold(0.5)